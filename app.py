@@ -2,10 +2,14 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import os, asyncio, shutil, time, hashlib
-from controller import send_mobile_files,handle_upload, download_media_from_channel
+import os, io, time
+from worker import submit_upload, submit_mobile, submit_download, recent_jobs
 from datetime import datetime, date, timedelta
-from model import config, load_metrics, load_logs
+from model import config, SUPPORTED_EXTENSIONS, load_metrics, load_logs, load_rollups
+from fs_index import folder_stats
+from duplicates import find_duplicates
+from archive import zip_folder
+from separate import PrefixRouter, PLACEMENT_MODES, OTHER_FOLDER, separate_files
 import re
 from dotenv import load_dotenv
 
@@ -17,6 +21,64 @@ def clean_folder_name(name):
     return re.sub(r'[<>:"/\\|?*\n\r\t]', '', name).strip()
 
 
+@st.cache_resource(max_entries=4)
+def load_router(sheet_bytes):
+    # Built once per sheet: username -> folder, matched by longest prefix
+    df = pd.read_excel(io.BytesIO(sheet_bytes), header=None)
+    username_to_folder = {}
+    for _, row in df.iterrows():
+        row = row.dropna().astype(str).tolist()
+        if len(row) < 3:
+            continue
+        folder_name = clean_folder_name(row[2])
+        for cell in row[1:]:
+            cell = cell.strip().lower()
+            if cell.startswith("http") or cell.isdigit():
+                continue
+            if len(cell) >= 3:
+                username_to_folder[cell] = folder_name
+    return PrefixRouter(username_to_folder)
+
+
+def show_log(log):
+    if log.startswith("✅"):
+        st.success(log)
+    elif log.startswith("❌"):
+        st.error(log)
+    elif log.startswith("⏳"):
+        st.warning(log)
+    else:
+        st.write(log)
+
+
+def show_jobs(kind):
+    """
+    Shows the latest background jobs of one kind; jobs run in worker.py, not in this script.
+    """
+    jobs = recent_jobs(kind)
+    if not jobs:
+        return
+    st.markdown("---")
+    st.subheader("🗂️ Jobs")
+    active = False
+    for job in jobs:
+        active = active or job["status"] in ("queued", "running")
+        elapsed = 0
+        if job["started_at"]:
+            end = datetime.fromisoformat(job["finished_at"]) if job["finished_at"] else datetime.now()
+            elapsed = (end - datetime.fromisoformat(job["started_at"])).total_seconds()
+        rate = job["bytes_done"] / (1024 * 1024) / elapsed if elapsed else 0
+        with st.expander(f"#{job['id']} · {job['status']} · {job['created_at'][:19]}", expanded=job["status"] == "running"):
+            if job["files_total"]:
+                st.progress(min(job["files_done"] / job["files_total"], 1.0))
+            st.text(f"{job['files_done']}/{job['files_total']} files · {job['bytes_done'] / (1024 * 1024):.1f} MB · {rate:.2f} MB/s")
+            for log in job["logs"]:
+                show_log(log)
+    if active and st.checkbox("Auto-refresh", value=True, key=f"refresh_{kind}"):
+        time.sleep(2)
+        st.rerun()
+
+
 # === PAGE SETUP ===
 st.set_page_config(page_title="Telegram Dashboard", layout="wide")
 
@@ -30,24 +92,15 @@ with st.sidebar:
     st.button("Help")
     st.button("Logout")
 
-# === LOAD LOG DATA ===
-if os.path.exists(config["log_file"]):
-    try:
-        df_log = pd.read_csv(config["log_file"], names=["Timestamp", "File", "Channel", "FileType"])
-    except:
-        df_log = pd.DataFrame(columns=["Timestamp", "File", "Channel", "FileType"])
-else:
-    df_log = pd.DataFrame(columns=["Timestamp", "File", "Channel", "FileType"])
-
 # === NAVIGATION ===
 
 if nav == "Dashboard":
     st.markdown("# 📊 Dashboard")
 
-    folders = len(os.listdir(config["base_path"])) if os.path.exists(config["base_path"]) else 0
-    files = sum(len(f) for _, _, f in os.walk(config["base_path"])) if os.path.exists(config["base_path"]) else 0
-    uploads = len(open(config["cache_file"]).readlines()) if os.path.exists(config["cache_file"]) else 0
-    channels = df_log["Channel"].nunique() if not df_log.empty else 0
+    folders, files, uploads = load_metrics(config["base_path"], config["db_file"])
+    # Charts read the daily rollups, so render time grows with days, not log rows
+    top_df = load_rollups(config["db_file"], ["channel"])
+    channels = len(top_df)
 
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("📁 Total Folders", folders)
@@ -57,16 +110,13 @@ if nav == "Dashboard":
 
     st.markdown("---")
     chart1, chart2 = st.columns(2)
-    if not df_log.empty:
-        df_log["Timestamp"] = pd.to_datetime(df_log["Timestamp"], errors="coerce")
-        df_chart = df_log[df_log["Timestamp"].notnull()]
-        chart_data = df_chart.groupby(df_chart["Timestamp"].dt.date).size().reset_index(name="Uploads")
+    if not top_df.empty:
+        chart_data = load_rollups(config["db_file"], ["day"])
         chart1.subheader("📈 Uploads Over Time")
-        chart1.plotly_chart(px.line(chart_data, x="Timestamp", y="Uploads", markers=True), use_container_width=True)
+        chart1.plotly_chart(px.line(chart_data, x="Date", y="Uploads", markers=True), use_container_width=True)
 
         chart2.subheader("📎 File Types")
-        filetype_counts = df_chart["FileType"].value_counts().reset_index()
-        filetype_counts.columns = ["FileType", "Count"]
+        filetype_counts = load_rollups(config["db_file"], ["file_type"]).rename(columns={"Uploads": "Count"})
         chart2.plotly_chart(px.pie(filetype_counts, names="FileType", values="Count"), use_container_width=True)
     else:
         chart1.info("No upload history yet.")
@@ -74,9 +124,8 @@ if nav == "Dashboard":
 
     st.markdown("---")
     st.subheader("🏆 Top Channels by Uploads")
-    if not df_log.empty:
-        top_df = df_log["Channel"].value_counts().reset_index()
-        top_df.columns = ["Channel", "Uploads"]
+    if not top_df.empty:
+        top_df = top_df.sort_values("Uploads", ascending=False)[["Channel", "Uploads"]]
         st.dataframe(top_df.head(5), use_container_width=True)
     else:
         st.info("No upload log yet.")
@@ -105,39 +154,20 @@ elif nav == "Separate Files":
         excel_file = st.file_uploader("Upload Excel File", type=["xlsx"])
         source_path = st.text_input("Source Folder Path")
         dest_path = st.text_input("Destination Base Folder")
+        placement = st.selectbox(
+            "Placement", PLACEMENT_MODES,
+            help="hardlink and reflink share the data instead of copying it and fall back to a copy "
+                 "when the filesystem cannot; move empties the source folder.",
+        )
         submitted = st.form_submit_button("Separate Files")
         if submitted and excel_file and source_path and dest_path:
-            df = pd.read_excel(excel_file, header=None)
-            username_to_folder = {}
-            for _, row in df.iterrows():
-                row = row.dropna().astype(str).tolist()
-                if len(row) < 3:
-                    continue
-                folder_name = clean_folder_name(row[2])
-                for cell in row[1:]:
-                    cell = cell.strip().lower()
-                    if cell.startswith("http") or cell.isdigit():
-                        continue
-                    if len(cell) >= 3:
-                        username_to_folder[cell] = folder_name
-
-            for folder in set(username_to_folder.values()):
-                os.makedirs(os.path.join(dest_path, folder), exist_ok=True)
-            os.makedirs(os.path.join(dest_path, "Other"), exist_ok=True)
-
-            for filename in os.listdir(source_path):
-                file_path = os.path.join(source_path, filename)
-                if not os.path.isfile(file_path):
-                    continue
-                matched = False
-                for username, folder_name in username_to_folder.items():
-                    if filename.lower().startswith(username):
-                        shutil.copy2(file_path, os.path.join(dest_path, folder_name, filename))
-                        matched = True
-                        break
-                if not matched:
-                    shutil.copy2(file_path, os.path.join(dest_path, "Other", filename))
-            st.success("✅ Files separated and copied.")
+            router = load_router(excel_file.getvalue())
+            per_folder, used, errors = separate_files(router, source_path, dest_path, placement, config["place_workers"])
+            st.success(f"✅ Placed {sum(per_folder.values())} files in {len(per_folder)} folders ({per_folder[OTHER_FOLDER]} in Other).")
+            if used.get("copy") and placement != "copy":
+                st.warning(f"⏳ {used['copy']} files were copied because {placement} is not supported there.")
+            for error in errors:
+                st.error(f"❌ {error}")
 
 # === UPLOADS TAB ===
 elif nav == "Uploads":
@@ -147,48 +177,52 @@ elif nav == "Uploads":
     upload_type = st.radio("Upload Type", ["Media Group", "One-by-One"])
 
     # --- Add filter selection UI ---
-    filter_method = st.selectbox("Filter files by:", ["None", "Name", "Date", "Size"])
+    filter_method = st.multiselect("Filter files by (all must match):", ["Name", "Regex", "Date", "Size", "Type"])
 
     filter_params = {}
+    filter_error = None
 
-    if filter_method == "Name":
-        name_filter = st.text_input("Enter part of filename to filter by:")
+    if "Name" in filter_method:
+        name_filter = st.text_input("Enter part of filename, or a letter range like A-H:")
         filter_params['name_filter'] = name_filter.strip()
 
-    elif filter_method == "Date":
+    if "Regex" in filter_method:
+        filter_params['name_regex'] = st.text_input("Filename regular expression:").strip()
+        try:
+            re.compile(filter_params['name_regex'])
+        except re.error as e:
+            filter_error = f"❌ Invalid regular expression: {e}"
+            st.error(filter_error)
+
+    if "Date" in filter_method:
         start_date = st.date_input("Start Date")
         end_date = st.date_input("End Date")
         filter_params['start_date'] = start_date
         filter_params['end_date'] = end_date
 
-    elif filter_method == "Size":
+    if "Size" in filter_method:
         min_size = st.number_input("Min size (KB)", min_value=0)
         max_size = st.number_input("Max size (KB, 0 means no max)", min_value=0)
         filter_params['min_size'] = min_size
         filter_params['max_size'] = max_size
-        
+
+    if "Type" in filter_method:
+        filter_params['file_types'] = st.multiselect("File types", sorted(SUPPORTED_EXTENSIONS))
+
     if mode_select == "Excel Upload":
         excel_file = st.file_uploader("Upload Excel File (Channel Link + Actress)", type=["xlsx"])
         upload_btn = st.button("Start Upload")
-        if excel_file and upload_btn:
+        if excel_file and upload_btn and filter_error:
+            st.error(filter_error)
+        elif excel_file and upload_btn:
             df_upload = pd.read_excel(excel_file)
 
             # Then on button click pass filter_params to handle_upload
             if excel_file and upload_btn:
                 df_upload = pd.read_excel(excel_file)
                 if "Channel Link" in df_upload.columns and "Actress" in df_upload.columns:
-                    logs = asyncio.run(handle_upload(df_upload, mode=upload_type, filter_method=filter_method, filter_params=filter_params))
-                    # for log in logs:
-                    #     st.write(log)
-                    for log in logs:
-                        if log.startswith("✅"):
-                            st.success(log)
-                        elif log.startswith("❌"):
-                            st.error(log)
-                        elif log.startswith("⏳"):
-                            st.warning(log)
-                        else:
-                            st.write(log)
+                    job_id = submit_upload(df_upload, mode=upload_type, filter_method=filter_method, filter_params=filter_params)
+                    st.success(f"✅ Upload job #{job_id} queued")
                 else:
                     st.error("Missing required columns in Excel: 'Channel Link' and 'Actress'")
                     
@@ -204,9 +238,9 @@ elif nav == "Uploads":
         upload_btn2 = st.button("Upload Manually")
         if channel and actress and upload_btn2:
             df_upload = pd.DataFrame([{"Channel Link": channel, "Actress": actress}])
-            logs = asyncio.run(handle_upload(df_upload, mode=upload_type))
-            for log in logs:
-                st.write(log)
+            job_id = submit_upload(df_upload, mode=upload_type)
+            st.success(f"✅ Upload job #{job_id} queued")
+    show_jobs("upload")
 
 elif nav == "Mobile Upload":
     
@@ -214,18 +248,19 @@ elif nav == "Mobile Upload":
     channel = st.text_input("Telegram Channel Username or Link")
     files = st.file_uploader("Select files to upload", accept_multiple_files=True)
     if st.button("🚀 Upload Now") and channel and files:
-        logs = asyncio.run(send_mobile_files(channel, files))
-        for log in logs:
-            st.success(log)
+        job_id = submit_mobile(channel, files)
+        st.success(f"✅ Mobile upload job #{job_id} queued")
+    show_jobs("mobile")
 
 # === Download Media ===
 elif nav == "Download Media":
     st.header("📥 Download Files from Telegram Channel")
     channel_link = st.text_input("Enter Telegram Channel Username or Link")
     save_path = st.text_input("Enter Download Folder Path", value="D:/TelegramDownloads")
-    if st.button("Download All Media"):
-        count = asyncio.run(download_media_from_channel(channel_link, save_path))
-        st.success(f"✅ Downloaded {count} media files.")
+    if st.button("Download All Media") and channel_link:
+        job_id = submit_download(channel_link, save_path)
+        st.success(f"✅ Download job #{job_id} queued")
+    show_jobs("download")
 
 elif nav == "Folder Inspector":
     st.header("🗂️ Folder Inspector & Cleaner")
@@ -233,29 +268,9 @@ elif nav == "Folder Inspector":
     folder_path = st.text_input("Enter Folder Path to Inspect")
 
     def get_folder_stats(folder_path):
-        total_size = 0
-        total_files = 0
-        for root, dirs, files in os.walk(folder_path):
-            total_files += len(files)
-            for f in files:
-                fp = os.path.join(root, f)
-                total_size += os.path.getsize(fp)
+        _, total_files, total_size = folder_stats(folder_path, config["fs_index_file"], config["fs_index_ttl"])
         return total_files, total_size
 
-    def find_duplicates(folder_path):
-        hashes = {}
-        duplicates = []
-        for root, dirs, files in os.walk(folder_path):
-            for f in files:
-                fp = os.path.join(root, f)
-                with open(fp, 'rb') as file:
-                    filehash = hashlib.md5(file.read()).hexdigest()
-                if filehash in hashes:
-                    duplicates.append((fp, hashes[filehash]))
-                else:
-                    hashes[filehash] = fp
-        return duplicates
-
     def delete_old_files(folder_path, days_old=30):
         now = datetime.now()
         cutoff = now - timedelta(days=days_old)
@@ -269,9 +284,6 @@ elif nav == "Folder Inspector":
                     deleted_files.append(fp)
         return deleted_files
 
-    def zip_folder(folder_path, output_path):
-        shutil.make_archive(output_path, 'zip', folder_path)
-
     if folder_path and os.path.exists(folder_path):
         total_files, total_size = get_folder_stats(folder_path)
         st.write(f"Total files: {total_files}")
@@ -292,9 +304,17 @@ elif nav == "Folder Inspector":
             st.success(f"Deleted {len(deleted)} files older than {days_old} days.")
 
         if st.button("Zip Folder"):
-            zip_output = folder_path.rstrip(os.sep) + "_zipped"
-            zip_folder(folder_path, zip_output)
-            st.success(f"Folder zipped to {zip_output}.zip")
+            zip_output = folder_path.rstrip(os.sep) + "_zipped.zip"
+            bar = st.progress(0.0)
+            status = st.empty()
+
+            def zip_progress(files_done, files_total, bytes_done, bytes_total, seconds):
+                bar.progress(bytes_done / bytes_total if bytes_total else 1.0)
+                rate = bytes_done / (1024 * 1024) / seconds if seconds else 0
+                status.text(f"{files_done}/{files_total} files · {bytes_done / (1024 * 1024):.1f} MB · {rate:.2f} MB/s")
+
+            zip_folder(folder_path, zip_output, config["zip_workers"], progress=zip_progress)
+            st.success(f"Folder zipped to {zip_output}")
     else:
         st.info("Enter a valid existing folder path.")
 
@@ -324,37 +344,39 @@ elif nav == "📄 Excel Sheet Manager":
 # Analytics (placeholder)
 elif nav == "Analytics":
     st.header("📈 Analytics")
-    if not os.path.exists(config["log_file"]):
+    options = load_rollups(config["db_file"], ["channel", "file_type"])
+    if options.empty:
         st.warning("No logs found yet.")
     else:
-        df = pd.read_csv(config["log_file"], names=["Timestamp", "File", "Channel", "FileType"])
-        df["Timestamp"] = pd.to_datetime(df["Timestamp"], errors='coerce')
-        df.dropna(subset=["Timestamp"], inplace=True)
-        df["Date"] = df["Timestamp"].dt.date
-        start = st.date_input("Start Date", df["Date"].min())
-        end = st.date_input("End Date", df["Date"].max())
-        channel_filter = st.multiselect("Channel Filter", df["Channel"].unique())
-        type_filter = st.multiselect("File Type Filter", df["FileType"].unique())
-        filtered = df[(df["Date"] >= start) & (df["Date"] <= end)]
-        if channel_filter:
-            filtered = filtered[filtered["Channel"].isin(channel_filter)]
-        if type_filter:
-            filtered = filtered[filtered["FileType"].isin(type_filter)]
+        days = load_rollups(config["db_file"], ["day"])
+        start = st.date_input("Start Date", days["Date"].min())
+        end = st.date_input("End Date", days["Date"].max())
+        channel_filter = st.multiselect("Channel Filter", options["Channel"].unique())
+        type_filter = st.multiselect("File Type Filter", options["FileType"].unique())
+        filters = dict(start=start, end=end, channels=channel_filter, file_types=type_filter)
         col1, col2 = st.columns(2)
-        daily = filtered.groupby("Date").size().reset_index(name="Uploads")
+        daily = load_rollups(config["db_file"], ["day"], **filters)
         col1.plotly_chart(px.line(daily, x="Date", y="Uploads", title="Daily Upload Volume"), use_container_width=True)
-        ftypes = filtered["FileType"].value_counts().reset_index()
-        ftypes.columns = ["FileType", "Count"]
+        ftypes = load_rollups(config["db_file"], ["file_type"], **filters).rename(columns={"Uploads": "Count"})
         col2.plotly_chart(px.pie(ftypes, names="FileType", values="Count", title="File Types"), use_container_width=True)
-        ch_count = filtered["Channel"].value_counts().reset_index()
-        ch_count.columns = ["Channel", "Uploads"]
+        ch_count = load_rollups(config["db_file"], ["channel"], **filters).sort_values("Uploads", ascending=False)
         st.subheader("Uploads per Channel")
         st.plotly_chart(px.bar(ch_count, x="Channel", y="Uploads"), use_container_width=True)
-        st.download_button("📥 Download Filtered Logs", filtered.to_csv(index=False), file_name="filtered_uploads.csv")
+        # Raw rows are only needed for the export, so the log is loaded on request
+        if st.button("Prepare Filtered Logs"):
+            df_log, _ = load_logs(config["db_file"])
+            filtered = df_log[(df_log["Date"] >= start) & (df_log["Date"] <= end)]
+            if channel_filter:
+                filtered = filtered[filtered["Channel"].isin(channel_filter)]
+            if type_filter:
+                filtered = filtered[filtered["FileType"].isin(type_filter)]
+            st.download_button("📥 Download Filtered Logs", filtered.to_csv(index=False), file_name="filtered_uploads.csv")
 
 # === LOGS TAB ===
 elif nav == "Logs":
     st.title("🧾 Upload Logs")
+    # Cached across reruns and refreshed with new rows only; treat df_log as read-only
+    df_log, _ = load_logs(config["db_file"])
     if not df_log.empty:
         st.dataframe(df_log, use_container_width=True)
     else:
@@ -0,0 +1,220 @@
+# archive.py
+#
+# Streaming zip writer for the Folder Inspector. Media that is already compressed is
+# stored as is; everything else is deflated on a thread pool (zlib releases the GIL) into
+# spooled temp files, a bounded number of entries ahead of the writer. The archive is
+# written in order straight to disk, so memory use does not grow with the folder.
+# Uses ZIP64 records where sizes, offsets or entry counts need them.
+
+import os
+import time
+import zlib
+import struct
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+STORED_TYPES = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.mp4', '.mov', '.mkv', '.avi', '.webm',
+    '.mp3', '.m4a', '.aac', '.ogg', '.opus', '.flac', '.zip', '.rar', '.7z', '.gz', '.bz2',
+    '.xz', '.zst', '.pdf', '.docx', '.xlsx', '.pptx',
+}
+CHUNK_SIZE = 1024 * 1024
+SPOOL_SIZE = 4 * 1024 * 1024    # compressed entries larger than this go to a temp file
+PROGRESS_INTERVAL = 0.25
+
+_STORED, _DEFLATED = 0, 8
+_UTF8_FLAG = 0x800
+_LIMIT = 0xFFFFFFFF     # sizes and offsets from here on need ZIP64 records
+_MASK = 0xFFFFFFFF      # placeholder written in 32-bit fields that moved to ZIP64
+
+
+def _fit(value):
+    return _MASK if value >= _LIMIT else value
+
+
+def _dos_time(mtime):
+    t = time.localtime(mtime)
+    year = min(max(t.tm_year, 1980), 2107)
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def _walk(folder_path, skip):
+    # (path or None for directories, archive name, size, mtime) in a stable order
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        rel = os.path.relpath(root, folder_path)
+        prefix = "" if rel == "." else rel.replace(os.sep, "/") + "/"
+        if prefix:
+            yield None, prefix, 0, os.stat(root).st_mtime
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if os.path.abspath(path) in skip:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield path, prefix + name, st.st_size, st.st_mtime
+
+
+def _deflate(path, level):
+    # Returns (crc, size, spooled compressed data), or None if deflating did not help
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    out = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+    crc = size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            out.write(compressor.compress(chunk))
+    out.write(compressor.flush())
+    if out.tell() >= size:
+        out.close()
+        return None
+    out.seek(0)
+    return crc, size, out
+
+
+class _ZipWriter:
+    def __init__(self, f):
+        self.f = f
+        self.central = []
+
+    def _local_header(self, name, method, dos, crc, csize, usize):
+        big = usize >= _LIMIT or csize >= _LIMIT
+        extra = struct.pack("<HHQQ", 1, 16, usize, csize) if big else b""
+        sizes = (_MASK, _MASK) if big else (csize, usize)
+        self.f.write(struct.pack(
+            "<4sHHHHHLLLHH", b"PK\x03\x04", 45 if big else 20, _UTF8_FLAG, method,
+            dos[0], dos[1], crc, sizes[0], sizes[1], len(name), len(extra),
+        ) + name + extra)
+
+    def add(self, arcname, mtime, method, crc, usize, csize, write_data):
+        """
+        Writes one entry; write_data(f) writes csize bytes and returns their crc for
+        stored entries whose crc is not known up front (pass crc=None).
+        """
+        name = arcname.encode("utf-8")
+        dos = _dos_time(mtime)
+        offset = self.f.tell()
+        self._local_header(name, method, dos, crc or 0, csize, usize)
+        if crc is None:
+            crc = write_data(self.f)
+            end = self.f.tell()
+            self.f.seek(offset)
+            self._local_header(name, method, dos, crc, csize, usize)
+            self.f.seek(end)
+        else:
+            write_data(self.f)
+        self.central.append((name, method, dos, crc, usize, csize, offset))
+
+    def close(self):
+        start = self.f.tell()
+        for name, method, dos, crc, usize, csize, offset in self.central:
+            values = [v for v in (usize, csize, offset) if v >= _LIMIT]
+            extra = struct.pack("<HH", 1, 8 * len(values)) + struct.pack(f"<{len(values)}Q", *values) if values else b""
+            self.f.write(struct.pack(
+                "<4sHHHHHHLLLHHHHHLL", b"PK\x01\x02", 45, 45 if values else 20, _UTF8_FLAG, method,
+                dos[0], dos[1], crc, _fit(csize), _fit(usize),
+                len(name), len(extra), 0, 0, 0, 0, _fit(offset),
+            ) + name + extra)
+        end = self.f.tell()
+        count, size = len(self.central), end - start
+        if count >= 0xFFFF or size >= _LIMIT or start >= _LIMIT:
+            self.f.write(struct.pack("<4sQHHLLQQQQ", b"PK\x06\x06", 44, 45, 45, 0, 0, count, count, size, start))
+            self.f.write(struct.pack("<4sLQL", b"PK\x06\x07", 0, end, 1))
+        self.f.write(struct.pack(
+            "<4sHHHHLLH", b"PK\x05\x06", 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            _fit(size), _fit(start), 0,
+        ))
+
+
+def _copy_stored(path, size):
+    def write_data(f):
+        crc = 0
+        remaining = size
+        with open(path, "rb") as src:
+            while remaining:
+                chunk = src.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise OSError(f"{path} shrank while it was being archived")
+                crc = zlib.crc32(chunk, crc)
+                f.write(chunk)
+                remaining -= len(chunk)
+        return crc
+    return write_data
+
+
+def _copy_spooled(data):
+    def write_data(f):
+        with data:
+            for chunk in iter(lambda: data.read(CHUNK_SIZE), b""):
+                f.write(chunk)
+    return write_data
+
+
+def zip_folder(folder_path, output_path, workers=4, level=6, progress=None):
+    """
+    Zips the contents of folder_path into output_path.
+
+    Args:
+        progress: Called as progress(files_done, files_total, bytes_done, bytes_total, seconds)
+            at most every PROGRESS_INTERVAL seconds and after the last file.
+
+    Returns:
+        (files, bytes read, seconds)
+    """
+    output_path = os.path.abspath(output_path)
+    entries = list(_walk(folder_path, {output_path, output_path + ".part"}))
+    files_total = sum(1 for path, *_ in entries if path)
+    bytes_total = sum(size for *_, size, _ in entries)
+    files_done = bytes_done = 0
+    started = reported = time.monotonic()
+
+    with ThreadPoolExecutor(workers) as pool, open(output_path + ".part", "wb") as f:
+        writer = _ZipWriter(f)
+        pending = deque()
+        upcoming = iter(entries)
+
+        def fill():
+            # Keep a few entries deflating ahead of the writer
+            while len(pending) < workers * 2:
+                entry = next(upcoming, None)
+                if entry is None:
+                    return
+                path, arcname = entry[0], entry[1]
+                deflate = path and os.path.splitext(arcname)[1].lower() not in STORED_TYPES
+                pending.append((entry, pool.submit(_deflate, path, level) if deflate else None))
+
+        fill()
+        try:
+            while pending:
+                (path, arcname, size, mtime), future = pending.popleft()
+                fill()
+                if path is None:
+                    writer.add(arcname, mtime, _STORED, 0, 0, 0, lambda f: None)
+                    continue
+                compressed = future.result() if future else None
+                if compressed:
+                    crc, usize, data = compressed
+                    csize = data.seek(0, os.SEEK_END)
+                    data.seek(0)
+                    writer.add(arcname, mtime, _DEFLATED, crc, usize, csize, _copy_spooled(data))
+                else:
+                    usize = size
+                    writer.add(arcname, mtime, _STORED, None, size, size, _copy_stored(path, size))
+                files_done += 1
+                bytes_done += usize
+                now = time.monotonic()
+                if progress and (now - reported >= PROGRESS_INTERVAL or files_done == files_total):
+                    reported = now
+                    progress(files_done, files_total, bytes_done, bytes_total, now - started)
+        except BaseException:
+            for _, future in pending:
+                if future:
+                    future.cancel()
+            raise
+        writer.close()
+    os.replace(output_path + ".part", output_path)
+    return files_done, bytes_done, time.monotonic() - started
@@ -0,0 +1,159 @@
+# client_pool.py
+#
+# Process-wide pool of connected, authorised Telegram clients. Jobs lease a client instead
+# of connecting and logging in themselves, so a job starts on a warm connection. Leases can
+# share a client (Telethon multiplexes requests on one connection); when every client of a
+# session is busy, the pool opens another connection with the same authorisation, up to
+# CLIENT_CONNECTIONS per session. Idle clients are pinged every CLIENT_HEALTH_SECONDS and
+# reconnected or dropped when the ping fails.
+
+import os
+import random
+import asyncio
+import contextlib
+from collections import defaultdict
+from telethon import TelegramClient, functions
+from telethon.errors import SessionPasswordNeededError
+from telethon.sessions import StringSession
+from model import config
+
+PING_TIMEOUT = 10
+
+
+async def connect_client(session):
+    """
+    Connects and logs in a client on a session file, disconnecting it again if that fails.
+    """
+    client = TelegramClient(session, config["api_id"], config["api_hash"])
+    try:
+        try:
+            await client.start(phone=config["phone"])
+        except SessionPasswordNeededError:
+            # If user has 2FA password enabled
+            password = os.getenv("TELEGRAM_PASSWORD")  # load from environment variable
+            if not password:
+                import streamlit as st
+                password = st.text_input("🔑 Enter your Telegram 2FA Password", type="password")
+            await client.sign_in(password=password)
+    except BaseException:
+        await client.disconnect()
+        raise
+    return client
+
+
+class _Slot:
+    def __init__(self, client):
+        self.client = client
+        self.leases = 0
+
+
+class ClientPool:
+    def __init__(self, connections_per_session=2, health_interval=60):
+        self.connections_per_session = max(connections_per_session, 1)
+        self.health_interval = health_interval
+        self._slots = defaultdict(list)     # session -> [_Slot], the first one on the session file
+        self._locks = defaultdict(asyncio.Lock)
+        self._loop = None
+        self._health_task = None
+
+    def _bind_loop(self):
+        # Clients belong to the event loop that created them; a new loop starts a fresh pool
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._slots.clear()
+            self._locks.clear()
+            self._health_task = loop.create_task(self._check_health())
+
+    async def _new_client(self, session, slots):
+        if not slots:
+            client = await connect_client(session)
+        else:
+            # Another connection with the same auth key; no second login needed
+            client = TelegramClient(
+                StringSession(StringSession.save(slots[0].client.session)), config["api_id"], config["api_hash"]
+            )
+            try:
+                await client.connect()
+                if not await client.is_user_authorized():
+                    raise ConnectionError(f"Extra connection for {session} is not authorised")
+            except BaseException:
+                await client.disconnect()
+                raise
+        # FloodWaits surface to the callers' UploadSchedulers instead of sleeping inside Telethon
+        client.flood_sleep_threshold = 0
+        return client
+
+    async def _acquire(self, session):
+        self._bind_loop()
+        async with self._locks[session]:
+            slots = self._slots[session]
+            slot = min(slots, key=lambda s: s.leases, default=None)
+            if slot is None or (slot.leases and len(slots) < self.connections_per_session):
+                slot = _Slot(await self._new_client(session, slots))
+                slots.append(slot)
+            elif not slot.client.is_connected():
+                await slot.client.connect()
+            slot.leases += 1
+            return slot
+
+    async def _discard(self, session, slot):
+        if slot in self._slots[session]:
+            self._slots[session].remove(slot)
+        await slot.client.disconnect()
+
+    @contextlib.asynccontextmanager
+    async def client(self, session):
+        """
+        Leases a connected, authorised client for session:
+
+            async with pool.client(session) as client:
+                ...
+
+        The client goes back to the pool afterwards; if the connection broke it is
+        disconnected and the next lease gets a new one.
+        """
+        slot = await self._acquire(session)
+        try:
+            yield slot.client
+        except (ConnectionError, asyncio.TimeoutError):
+            await self._discard(session, slot)
+            raise
+        finally:
+            slot.leases -= 1
+
+    async def _ping(self, session, slot):
+        try:
+            if not slot.client.is_connected():
+                await slot.client.connect()
+            await asyncio.wait_for(slot.client(functions.PingRequest(ping_id=random.getrandbits(63))), PING_TIMEOUT)
+        except Exception:
+            await slot.client.disconnect()
+            try:
+                await slot.client.connect()
+            except Exception as e:
+                print(f"Dropping Telegram client for {session}: {e}")
+                await self._discard(session, slot)
+
+    async def _check_health(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for session, slots in list(self._slots.items()):
+                for slot in [s for s in slots if not s.leases]:
+                    await self._ping(session, slot)
+
+    async def close(self):
+        """
+        Disconnects every client; call before the event loop ends.
+        """
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        for slots in self._slots.values():
+            for slot in slots:
+                await slot.client.disconnect()
+        self._slots.clear()
+        self._loop = None
+
+
+pool = ClientPool(config["client_connections"], config["client_health_seconds"])
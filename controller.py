@@ -1,20 +1,23 @@
 import os
-import shutil
 import asyncio
+import contextlib
+from collections import defaultdict
 from datetime import datetime, date
-from telethon import TelegramClient
+from telethon import utils
 from telethon.errors import FloodWaitError
 from telethon.tl.types import DocumentAttributeFilename, MessageMediaPhoto
-from telethon.errors import SessionPasswordNeededError
-from model import config, filter_files,convert_to_jpg
-import streamlit as st
+from telethon.errors import FileReferenceExpiredError, FileReferenceInvalidError, MediaEmptyError
+from telethon.errors import FilePartMissingError, FilePartsInvalidError
+from telethon.tl.types import InputPhoto, InputDocument
+from model import config, SUPPORTED_EXTENSIONS, scan_folder, filter_files, convert_stream, release_conversion, content_hash, pack_media_groups
+import store
+from scheduler import UploadScheduler
+from fast_upload import is_large_file, upload_file, uploaded_document
+from client_pool import pool
+from entities import STALE_PEER_ERRORS, entity_key, resolve_entity, forget_entity, preresolve_entities
+from perceptual import PerceptualIndex, start_hashes, channel_index, remember
 from dotenv import load_dotenv
 
-# === SUPPORTED TYPES ===
-MEDIA_GROUP_TYPES = ('.jpg', '.jpeg', '.png', '.mp4', '.mov', '.mkv', '.pdf', '.docx', '.heic', '.webp')
-OTHER_TYPES = ('.zip', '.rar', '.7z', '.txt', '.xls', '.ppt', '.exe')
-SUPPORTED_EXTENSIONS = MEDIA_GROUP_TYPES + OTHER_TYPES
-
 # session_name = config["session_name"]
 # session_folder = os.path.join(os.getcwd(), "session")
 
@@ -26,214 +29,532 @@ os.makedirs(BASE_PATH, exist_ok=True)
 
 session_path = os.path.join(BASE_PATH, "my_session.session")
 
-async def handle_upload(df_upload, mode, filter_method="None", filter_params=None):
-    logs = []
+
+def no_progress(files=0, nbytes=0, total=0):
+    """
+    Default progress callback; the background worker passes one that updates the job row.
+    """
+
+
+def upload_scheduler(logs):
+    """
+    FloodWaits are handled per channel by the scheduler instead of inside Telethon
+    (pooled clients have flood_sleep_threshold = 0).
+    """
+    return UploadScheduler(
+        config["upload_concurrency"],
+        config["channel_concurrency"],
+        on_flood_wait=lambda channel, seconds: logs.append(f"⏳ FloodWait on {channel}: pausing this channel for {seconds} seconds"),
+    )
+
+
+def row_folder(row):
+    """
+    (folder as written in the sheet, absolute folder path) for a sheet row.
+    """
+    folder_raw = str(row["Actress"]).strip()
+    folder = folder_raw if os.path.isabs(folder_raw) else os.path.join(config["base_path"], folder_raw)
+    return folder_raw, os.path.abspath(folder)
+
+
+def delete_sent(conn, rows, sent_paths, logs):
+    """
+    Deletes sent or skipped sources (and their converted copies) once every sheet row
+    mapped to the source's folder has recorded it as sent or skipped, so a file shared by
+    several channels stays until the last of them has it. Call only after every row is done; pass all of the sheet's rows,
+    including the ones that were not run.
+
+    Args:
+        sent_paths: {source path: path that was uploaded, or the source itself if skipped}
+    """
+    channels = defaultdict(list)     # absolute folder -> [(folder as in the sheet, channel)]
+    for row in rows:
+        folder_raw, folder = row_folder(row)
+        if folder_raw and folder_raw.lower() != "nan":
+            channels[folder].append((folder_raw, str(row["Channel Link"]).strip()))
+    recorded = {}
+    for source, upload_path in sent_paths.items():
+        folder, name = os.path.split(os.path.abspath(source))
+        missing = []
+        for key in channels[folder]:
+            if key not in recorded:
+                recorded[key] = store.handled_names(conn, *key)
+            if name not in recorded[key]:
+                missing.append(key[1])
+        if missing:
+            logs.append(f"📌 Kept {name}: not sent to {', '.join(missing)} yet")
+            continue
+        for path in {source, upload_path}:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass    # a converted copy the cache has pruned already
+            except Exception as e:
+                logs.append(f"❌ Could not delete {path}: {e}")
+
+
+async def handle_upload(df_upload, mode, filter_method="None", filter_params=None, progress=no_progress, logs=None):
+    logs = logs if logs is not None else []
     filter_params = filter_params or {}
-    client = TelegramClient(session_path, config["api_id"], config["api_hash"])
+    conn = store.connect(config["db_file"])
+    for cache_file in (config["cache_file"], config["temp_cache_file"]):
+        imported = store.import_text_cache(conn, cache_file)
+        if imported:
+            logs.append(f"✅ Imported {imported} entries from {cache_file}")
+
+    scheduler = upload_scheduler(logs)
+    hash_locks = defaultdict(asyncio.Lock)
+    hash_limit = asyncio.Semaphore(config["hash_workers"])
+    sent_paths = {}
     try:
-        await client.start(phone=config["phone"])
-    except SessionPasswordNeededError:
-        # If user has 2FA password enabled
-        password = os.getenv("TELEGRAM_PASSWORD")  # load from environment variable
-        if not password:
-            import streamlit as st
-            password = st.text_input("🔑 Enter your Telegram 2FA Password", type="password")
-        await client.sign_in(password=password)
-    logs.append("✅ Logged into Telegram")
-
-
-    uploaded = set()
-    if os.path.exists(config["cache_file"]):
-        with open(config["cache_file"], "r") as f:
-            uploaded = set(line.strip() for line in f.readlines())
-
-    for index, row in df_upload.iterrows():
-        channel = str(row["Channel Link"]).strip()
-        folder_raw = str(row["Actress"]).strip()
-
-        if not folder_raw or folder_raw.lower() == "nan":
-            logs.append(f"❌ Invalid folder name at row {index + 2}")
-            continue
+        async with pool.client(session_path) as client:
+            logs.append("✅ Logged into Telegram")
+            unreachable = await preresolve_entities(client, scheduler, conn, df_upload["Channel Link"], logs)
+            rows = [(index, row) for index, row in df_upload.iterrows() if entity_key(row["Channel Link"]) not in unreachable]
+            # A failing row must not stop the others, and conn stays open until every row is done
+            results = await asyncio.gather(*(
+                upload_folder(client, scheduler, conn, hash_locks, hash_limit, sent_paths, index, row, mode, filter_method, filter_params, logs, progress)
+                for index, row in rows
+            ), return_exceptions=True)
+            for (index, row), result in zip(rows, results):
+                if isinstance(result, Exception):
+                    logs.append(f"❌ Upload failed for row {index + 2} ({row['Actress']}): {result}")
+        delete_sent(conn, [row for _, row in df_upload.iterrows()], sent_paths, logs)
+    finally:
+        conn.close()
+    return logs
 
-        folder = folder_raw if os.path.isabs(folder_raw) else os.path.join(config["base_path"], folder_raw)
-        if not os.path.exists(folder):
-            logs.append(f"❌ Folder not found: {folder}")
-            continue
 
-        try:
-            entity = await client.get_entity(channel)
-        except Exception as e:
-            logs.append(f"❌ Cannot access channel: {folder}  ----->   {channel} | {e}")
-            continue
+async def prepare_upload(client, path_or_file, conn=None):
+    """
+    Uploads large files in parallel parts so send_file only has to post the handle.
+    Passing the store connection makes the upload resumable after a crash.
 
-        all_files = os.listdir(folder)
-        files = [
-            f for f in all_files
-            if os.path.splitext(f)[1].lower() in SUPPORTED_EXTENSIONS
-            and os.path.join(folder_raw, f) not in uploaded
-        ]
+    Returns:
+        The file or media to pass to send_file; small files come back untouched.
+    """
+    if not is_large_file(path_or_file, config["large_file_mb"]):
+        return path_or_file
+    if not config["resumable_uploads"]:
+        conn = None
+    handle = await upload_file(client, path_or_file, config["upload_part_size_kb"], config["upload_workers"], conn=conn)
+    return uploaded_document(handle, path_or_file)
 
-                # Apply filtering here based on filter_method and filter_params
-        files = filter_files(files, folder, filter_method, filter_params)
 
-        if not files:
-            logs.append(f"📁 No new files found in: {folder} after filtering")
-            continue
+def media_from_ref(ref):
+    kind, media_id, access_hash, file_reference = ref
+    if kind == "photo":
+        return InputPhoto(media_id, access_hash, file_reference)
+    return InputDocument(media_id, access_hash, file_reference)
 
-        # if not files:
-        #     logs.append(f"📁 No new files found in: {folder}")
-        #     continue
 
-        st.write(f"📤 Uploading {len(files)} files from: {folder}")
-        progress_text = st.empty()
-        bar = st.progress(0)
-        # media_paths = [os.path.join(folder, f) for f in files]
-        media_paths = [convert_to_jpg(os.path.join(folder, f)) for f in files]
-        
-        if mode == "Media Group":
-            batch_size = 10
-            for i in range(0, len(media_paths), batch_size):
-                batch = media_paths[i:i+batch_size]
-                uploaded_this_batch = False
-                while not uploaded_this_batch:
-                    try:
-                        await client.send_file(entity, batch, caption=f"📤 Batch Upload on {date.today().strftime('%d/%m/%Y')}")
-                        for f in batch:
-                            filename = os.path.basename(f)
-                            with open(config["temp_cache_file"], 'a') as fc:
-                                fc.write(os.path.join(folder_raw, filename) + '\n')
-                            with open(config["temp_log_file"], 'a') as fl:
-                                fl.write(f"{datetime.now().isoformat()},{filename},{channel},Media\n")
-                            try:
-                                os.remove(f)
-                            except Exception as e:
-                                logs.append(f"❌ Could not delete {f}: {e}")
-                            if f.endswith(".jpg") and not filename in all_files:
-                                try:
-                                    os.remove(f)
-                                except Exception as e:
-                                    logs.append(f"❌ Could not delete {f}: {e}")
-                        uploaded_this_batch = True
-                        bar.progress(min((i + batch_size) / len(media_paths), 1.0))
-                        progress_text.text(f"📤 Uploaded {min(i + batch_size, len(media_paths))}/{len(media_paths)} files")
-                    except FloodWaitError as e:
-                        logs.append(f"⏳ FloodWait: Sleeping for {e.seconds} seconds")
-                        await asyncio.sleep(e.seconds)
-                    except Exception as e:
-                        logs.append(f"❌ Media group batch upload failed: {e}")
-                        uploaded_this_batch = True
-
-        else:  # One-by-One
-            for i, file in enumerate(files):
-                path = os.path.join(folder, file)
-                uploaded_this_file = False
-                while not uploaded_this_file:
-                    try:
-                        await client.send_file(entity, path, caption=file + "\n" + f"Batch Upload on {date.today().strftime('%d/%m/%Y')}")
-                        with open(config["temp_cache_file"], 'a') as f:
-                            f.write(os.path.join(folder_raw, file) + '\n')
-                        with open(config["temp_log_file"], 'a') as f:
-                            f.write(f"{datetime.now().isoformat()},{file},{channel},Uploaded\n")
-                        try:
-                            os.remove(path)
-                        except Exception as e:
-                            logs.append(f"❌ Could not delete {file}: {e}")
-                        # Delete temp jpg if converted
-                        if path.endswith(".jpg") and not file.endswith(".jpg"):
-                            try:
-                                os.remove(path)
-                            except Exception as e:
-                                logs.append(f"❌ Could not delete temp file {path}: {e}")
-                        bar.progress((i + 1) / len(files))
-                        progress_text.text(f"📤 Uploaded {i+1}/{len(files)} files")
-                        uploaded_this_file = True
-                    except FloodWaitError as e:
-                        logs.append(f"⏳ FloodWait: Sleeping for {e.seconds} seconds")
-                        await asyncio.sleep(e.seconds)
-                    except Exception as e:
-                        logs.append(f"❌ Upload failed: {file} | {e}")
-                        uploaded_this_file = True
+def ref_from_message(message):
+    if message.photo:
+        return "photo", message.photo.id, message.photo.access_hash, message.photo.file_reference
+    if message.document:
+        return "document", message.document.id, message.document.access_hash, message.document.file_reference
+    return None
 
-        logs.append(f"✅ Completed upload for: {folder}  ----->   {channel}")
 
-    await client.disconnect()
+async def send_once(client, scheduler, conn, hash_locks, channel, entity, paths, hashes, **kwargs):
+    """
+    Sends one file or an album, uploading only content Telegram does not already hold.
 
-    # Save logs and cache
-    if os.path.exists(config["temp_log_file"]):
-        with open(config["temp_log_file"], "r") as temp_log, open(config["log_file"], "a") as main_log:
-            shutil.copyfileobj(temp_log, main_log)
+    Files whose hash has been sent before (to any channel) are re-sent by media
+    reference; the rest are uploaded and their references saved for the next channel.
+    """
+    async with contextlib.AsyncExitStack() as stack:
+        # Sorted so two albums sharing files can never wait on each other
+        for h in sorted(set(hashes)):
+            await stack.enter_async_context(hash_locks[h])
 
-    if os.path.exists(config["temp_cache_file"]):
-        with open(config["temp_cache_file"], "r") as temp_cache, open(config["cache_file"], "a") as main_cache:
-            shutil.copyfileobj(temp_cache, main_cache)
+        restarted = False
+        while True:
+            refs = [store.get_media_ref(conn, h) for h in hashes]
+            media = []
+            for path, ref in zip(paths, refs):
+                if ref:
+                    media.append(media_from_ref(ref))
+                else:
+                    media.append(await scheduler.run(channel, prepare_upload, client, path, conn))
 
-    return logs
+            try:
+                result = await scheduler.run(channel, client.send_file, entity, media[0] if len(media) == 1 else media, **kwargs)
+                break
+            except (FilePartMissingError, FilePartsInvalidError):
+                if restarted:
+                    raise
+                # Telegram no longer has the saved parts of a resumed upload
+                restarted = True
+                for path in paths:
+                    store.clear_upload_progress(conn, os.path.abspath(path))
+            except (FileReferenceExpiredError, FileReferenceInvalidError, MediaEmptyError):
+                if not any(refs):
+                    raise
+                # Stale references: forget them and upload the bytes again
+                for h, ref in zip(hashes, refs):
+                    if ref:
+                        store.drop_media_ref(conn, h)
 
+        for path in paths:
+            store.clear_upload_progress(conn, os.path.abspath(path))
+        messages = result if isinstance(result, list) else [result]
+        for h, message in zip(hashes, messages):
+            ref = ref_from_message(message)
+            if ref:
+                store.save_media_ref(conn, h, *ref)
+        return result
+
+
+# (dev, ino, size, mtime_ns) -> task hashing that file, so rows sharing a folder read it once
+_hashing = {}
+
+
+async def file_hashes(conn, hash_limit, folder, files):
+    """
+    Content hashes of files in folder. Unchanged files come from the store's
+    (device, inode, size, mtime) cache, shared with the duplicate finder; the rest are
+    read while holding hash_limit, a semaphore of HASH_WORKERS shared by every row of a run.
+    Files that vanished since the scan are left out.
+
+    Returns:
+        {name: content hash}
+    """
+    async def read(path, key):
+        async with hash_limit:
+            value = await asyncio.to_thread(content_hash, path)
+        store.save_file_hash(conn, *key, "full", value)
+        return value
+
+    hashes = {}
+    reading = {}
+    for f in files:
+        path = os.path.join(folder, f)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        cached = store.get_file_hash(conn, *key, "full")
+        if cached:
+            hashes[f] = cached
+            continue
+        if key not in _hashing:
+            _hashing[key] = asyncio.ensure_future(read(path, key))
+            _hashing[key].add_done_callback(lambda _, key=key: _hashing.pop(key, None))
+        reading[f] = _hashing[key]
+    for f, task in reading.items():
+        try:
+            # Shielded: another row may be waiting on the same task
+            hashes[f] = await asyncio.shield(task)
+        except OSError:
+            pass
+    return hashes
+
+
+async def upload_folder(client, scheduler, conn, hash_locks, hash_limit, sent_paths, index, row, mode, filter_method, filter_params, logs, progress, only=None):
+    """
+    Sends the files of one sheet row's folder that were not sent to its channel yet.
+    only limits this to the given file names (the watch daemon passes the files it saw settle).
+    """
+    channel = str(row["Channel Link"]).strip()
+    folder_raw, folder = row_folder(row)
+
+    if not folder_raw or folder_raw.lower() == "nan":
+        logs.append(f"❌ Invalid folder name at row {index + 2}")
+        return
+
+    if not os.path.exists(folder):
+        logs.append(f"❌ Folder not found: {folder}")
+        return
 
-async def send_mobile_files(channel_link, uploaded_files, st, config):
-    logs = []
-    client = TelegramClient(config["session_name"] + "_mobile", config["api_id"], config["api_hash"])
-    try:
-        await client.start(phone=config["phone"])
-    except SessionPasswordNeededError:
-        # If user has 2FA password enabled
-        password = os.getenv("TELEGRAM_PASSWORD")  # load from environment variable
-        if not password:
-            import streamlit as st
-            password = st.text_input("🔑 Enter your Telegram 2FA Password", type="password")
-        await client.sign_in(password=password)
     try:
-        entity = await client.get_entity(channel_link)
+        entity = await resolve_entity(client, scheduler, conn, channel)
     except Exception as e:
-        st.error(f"❌ Failed to access channel: {channel_link} | {e}")
+        logs.append(f"❌ Cannot access channel: {folder}  ----->   {channel} | {e}")
+        return
+
+    # One scandir pass; every filter below reads sizes and dates from this table
+    table = scan_folder(folder)
+    done = store.handled_names(conn, folder_raw, channel)
+    table = table[table["ext"].isin(SUPPORTED_EXTENSIONS) & ~table["name"].isin(done)]
+    if only is not None:
+        table = table[table["name"].isin(only)]
+    files = filter_files(table, filter_method, filter_params)
+
+    if not files:
+        logs.append(f"📁 No new files found in: {folder} after filtering")
         return
 
-    for file in uploaded_files:
+    hashes = await file_hashes(conn, hash_limit, folder, files)
+    files = [f for f in files if f in hashes]
+    already_sent = store.sent_hashes(conn, hashes.values(), channel)
+    seen = set()
+    skipped = []
+    for f in files:
+        if hashes[f] in already_sent or hashes[f] in seen:
+            skipped.append(f)
+        seen.add(hashes[f])
+    if skipped:
+        store.record_skips(conn, folder_raw, skipped, channel, "duplicate")
+        for f in skipped:
+            sent_paths.setdefault(os.path.join(folder, f), os.path.join(folder, f))
+        logs.append(f"⏭️ Skipped {len(skipped)} files already sent to {channel} under another name")
+        skipped = set(skipped)
+        files = [f for f in files if f not in skipped]
+        if not files:
+            return
+
+    logs.append(f"📤 Uploading {len(files)} files from: {folder}")
+    progress(total=len(files))
+
+    # Resized or re-encoded copies of media already in the channel, or earlier in this folder.
+    # Hashes start now in the process pool and each group only waits for its own files.
+    radius = config["near_dup_radius"]
+    phashes = start_hashes(conn, {f: (hashes[f], os.path.join(folder, f)) for f in files}) if radius else {}
+    seen_here = {}
+    visual = {}
+
+    async def drop_near_duplicates(batch):
+        kept, near, notes = [], [], []
+        for source, path in batch:
+            name = os.path.basename(source)
+            kind, row = await phashes[name]
+            if kind is None:
+                kept.append((source, path))
+                continue
+            local = seen_here.setdefault(kind, PerceptualIndex(len(row)))
+            matches = [channel_index(conn, channel, kind).nearest(row), local.nearest(row)]
+            close = [match for match in matches if match and match[0] <= radius]
+            if close:
+                near.append(name)
+                notes.append(f"{name} (like {close[0][1]})")
+            else:
+                local.add(row, name)
+                visual[name] = (kind, row)
+                kept.append((source, path))
+        if near:
+            store.record_skips(conn, folder_raw, near, channel, "near-duplicate")
+            for name in near:
+                sent_paths.setdefault(os.path.join(folder, name), os.path.join(folder, name))
+            logs.append(f"⏭️ Skipped near-duplicates of media already in {channel}: {', '.join(notes)}")
+            progress(files=len(near))
+        return kept
+
+    async def send_batch(batch):
+        nonlocal entity
+        names = [os.path.basename(source) for source, _ in batch]
+        paths = [path for _, path in batch]
+        batch_hashes = [hashes[f] for f in names]
+        if mode == "Media Group":
+            caption = f"📤 Batch Upload on {date.today().strftime('%d/%m/%Y')}"
+        else:
+            caption = names[0] + "\n" + f"Batch Upload on {date.today().strftime('%d/%m/%Y')}"
+        try:
+            try:
+                await send_once(client, scheduler, conn, hash_locks, channel, entity, paths, batch_hashes, caption=caption)
+            except STALE_PEER_ERRORS:
+                # The cached peer may be outdated: resolve the channel again and retry once
+                forget_entity(conn, channel)
+                entity = await resolve_entity(client, scheduler, conn, channel)
+                await send_once(client, scheduler, conn, hash_locks, channel, entity, paths, batch_hashes, caption=caption)
+        except Exception as e:
+            if mode == "Media Group":
+                logs.append(f"❌ Media group batch upload failed: {e}")
+            else:
+                logs.append(f"❌ Upload failed: {names[0]} | {e}")
+            return
+        store.record_uploads(conn, folder_raw, names, channel, batch_hashes)
+        for name in names:
+            if name in visual:
+                remember(conn, channel, *visual[name], name)
+        file_type = "Media" if mode == "Media Group" else "Uploaded"
+        store.record_log(conn, [
+            (datetime.now(), name, channel, file_type, os.path.getsize(source))
+            for name, (source, _) in zip(names, batch)
+        ])
+        for source, path in batch:
+            sent_paths[source] = path
+        progress(files=len(batch), nbytes=sum(os.path.getsize(path) for path in paths))
+
+    if mode == "Media Group":
+        size_of = dict(zip(table["name"], table["size"]))
+        sizes = [(f, int(size_of[f])) for f in files]
+        groups = pack_media_groups(sizes, max_bytes=config["group_max_mb"] * 1024 * 1024)
+    else:
+        groups = [[f] for f in files]
+
+    # Conversions run ahead in a process pool while earlier groups are being sent
+    group_sizes = iter([len(group) for group in groups])
+    batch_size = next(group_sizes)
+    batch = []
+    handed = []     # converted files stay pinned in the cache until their batch is done
+    try:
+        stream = convert_stream([os.path.join(folder, f) for group in groups for f in group])
+        async with contextlib.aclosing(stream):
+            async for source, path in stream:
+                handed.append(path)
+                batch.append((source, path))
+                if len(batch) == batch_size:
+                    if phashes:
+                        batch = await drop_near_duplicates(batch)
+                    if batch:
+                        await send_batch(batch)
+                    while handed:
+                        release_conversion(handed.pop())
+                    batch = []
+                    batch_size = next(group_sizes, 0)
+    finally:
+        for task in phashes.values():
+            task.cancel()
+        for path in handed:
+            release_conversion(path)
+
+    logs.append(f"✅ Completed upload for: {folder}  ----->   {channel}")
+
+
+async def send_mobile_files(channel_link, uploaded_files, progress=no_progress, logs=None):
+    logs = logs if logs is not None else []
+    scheduler = upload_scheduler(logs)
+    conn = store.connect(config["db_file"])
+    async with pool.client(session_path) as client:
         try:
-            await client.send_file(entity, file, caption=file.name)
-            with open(config["log_file"], 'a') as f:
-                f.write(f"{datetime.now().isoformat()},{file.name},{channel_link},mobile\n")
-            logs.append(f"✅ Uploaded: {file.name}")
+            entity = await resolve_entity(client, scheduler, conn, channel_link)
         except Exception as e:
-            logs.append(f"❌ Failed: {file.name} | {e}")
-    await client.disconnect()
+            logs.append(f"❌ Failed to access channel: {channel_link} | {e}")
+            conn.close()
+            return logs
+
+        progress(total=len(uploaded_files))
+        try:
+            for file in uploaded_files:
+                # Paths saved by the job queue, or file objects straight from st.file_uploader
+                name = os.path.basename(file if isinstance(file, str) else file.name)
+                try:
+                    # Files saved by the job queue resume from their last acknowledged part after a crash
+                    media = await prepare_upload(client, file, conn)
+                    await scheduler.run(channel_link, client.send_file, entity, media, caption=name)
+                    if isinstance(file, str):
+                        store.clear_upload_progress(conn, os.path.abspath(file))
+                    size = os.path.getsize(file) if isinstance(file, str) else file.size
+                    store.record_log(conn, [(datetime.now(), name, channel_link, "mobile", size)])
+                    logs.append(f"✅ Uploaded: {name}")
+                    progress(files=1, nbytes=size)
+                except Exception as e:
+                    if isinstance(e, STALE_PEER_ERRORS):
+                        forget_entity(conn, channel_link)
+                    logs.append(f"❌ Failed: {name} | {e}")
+        finally:
+            conn.close()
     return logs
 
 
-async def download_media_from_channel(channel_username, save_path, st, config):
+def media_filename(message):
+    if message.file and message.file.name:
+        return message.file.name
+    if isinstance(message.media, MessageMediaPhoto):
+        return f"photo_{message.id}.jpg"
+    if message.document:
+        for attr in message.document.attributes:
+            if isinstance(attr, DocumentAttributeFilename):
+                return attr.file_name
+    ext = message.file.ext or ".bin"
+    return f"file_{message.id}{ext}"
+
+
+async def download_media_from_channel(channel_username, save_path, logs=None, progress=no_progress):
+    logs = logs if logs is not None else []
     os.makedirs(save_path, exist_ok=True)
     downloaded = 0
-    client = TelegramClient(config["session_name"] + '_dl', config["api_id"], config["api_hash"])
+    # All downloads share one lane: a long FloodWait pauses every worker until it expires
+    workers = config["download_workers"]
+    scheduler = UploadScheduler(
+        workers, workers,
+        on_flood_wait=lambda channel, seconds: logs.append(f"⏳ FloodWait: pausing downloads for {seconds} seconds"),
+    )
+    conn = store.connect(config["db_file"])
     try:
-        await client.start(phone=config["phone"])
-    except SessionPasswordNeededError:
-        # If user has 2FA password enabled
-        password = os.getenv("TELEGRAM_PASSWORD")  # load from environment variable
-        if not password:
-            import streamlit as st
-            password = st.text_input("🔑 Enter your Telegram 2FA Password", type="password")
-        await client.sign_in(password=password)
-    entity = await client.get_entity(channel_username)
-    async for message in client.iter_messages(entity):
-        if message.media:
-            try:
-                filename = None
-                if message.file and message.file.name:
-                    filename = message.file.name
-                elif isinstance(message.media, MessageMediaPhoto):
-                    filename = f"photo_{message.id}.jpg"
-                elif message.document:
-                    for attr in message.document.attributes:
-                        if isinstance(attr, DocumentAttributeFilename):
-                            filename = attr.file_name
-                if not filename:
-                    ext = message.file.ext or ".bin"
-                    filename = f"file_{message.id}{ext}"
-                save_file = os.path.join(save_path, filename)
-                if not os.path.exists(save_file):
-                    await message.download_media(file=save_file)
-                    downloaded += 1
-            except Exception as e:
-                st.warning(f"❌ Error downloading media: {e}")
-    await client.disconnect()
+        async with pool.client(session_path) as client:
+            entity = await resolve_entity(client, scheduler, conn, channel_username)
+            queue = asyncio.Queue(maxsize=workers * 4)
+            claimed = set()
+
+            # Only messages newer than the last complete sync are fetched; known documents are skipped by id
+            channel_key = str(utils.get_peer_id(entity))
+            synced_id = store.get_synced_id(conn, channel_key)
+            known = store.downloaded_media_ids(conn, channel_key)
+            newest_id = synced_id
+            failed_ids = []
+            complete = True
+
+            async def produce():
+                nonlocal newest_id, complete
+                offset_id = 0
+                try:
+                    while True:
+                        try:
+                            # Newest first; after a FloodWait, continue below the last message seen
+                            async for message in client.iter_messages(entity, min_id=synced_id, offset_id=offset_id):
+                                newest_id = max(newest_id, message.id)
+                                offset_id = message.id
+                                if message.photo or message.document:
+                                    await queue.put(message)
+                            break
+                        except FloodWaitError as e:
+                            logs.append(f"⏳ FloodWait: pausing history for {e.seconds} seconds")
+                            await asyncio.sleep(e.seconds)
+                except Exception as e:
+                    complete = False
+                    if isinstance(e, STALE_PEER_ERRORS):
+                        forget_entity(conn, channel_username)
+                    logs.append(f"❌ Stopped reading channel history: {e}")
+                finally:
+                    for _ in range(workers):
+                        await queue.put(None)
+
+            async def consume():
+                nonlocal downloaded
+                while True:
+                    message = await queue.get()
+                    if message is None:
+                        return
+                    media_id = (message.photo or message.document).id
+                    if media_id in known:
+                        continue
+                    known.add(media_id)
+                    save_file = None
+                    try:
+                        filename = media_filename(message)
+                        save_file = os.path.join(save_path, filename)
+                        if os.path.exists(save_file) and os.path.getsize(save_file) == message.file.size:
+                            # Downloaded before the manifest existed
+                            store.record_download(conn, channel_key, media_id, message.id, filename)
+                            continue
+                        if save_file in claimed or os.path.exists(save_file):
+                            # Another document with the same name
+                            name, ext = os.path.splitext(filename)
+                            filename = f"{name}_{message.id}{ext}"
+                            save_file = os.path.join(save_path, filename)
+                        claimed.add(save_file)
+                        # Written under a temporary name so an interrupted download never looks finished
+                        partial = await scheduler.run(channel_username, message.download_media, file=save_file + ".part")
+                        os.replace(partial, save_file)
+                        store.record_download(conn, channel_key, media_id, message.id, filename)
+                        downloaded += 1
+                        progress(files=1, nbytes=os.path.getsize(save_file))
+                    except Exception as e:
+                        failed_ids.append(message.id)
+                        logs.append(f"❌ Error downloading media: {e}")
+                        # The next run downloads it again from the start, so drop the partial file
+                        if save_file:
+                            with contextlib.suppress(OSError):
+                                os.remove(save_file + ".part")
+
+            await asyncio.gather(produce(), *(consume() for _ in range(workers)))
+
+        # Failed messages must be fetched again next time, so the mark stops just below the oldest one
+        if complete:
+            store.set_synced_id(conn, channel_key, min(failed_ids) - 1 if failed_ids else newest_id)
+    finally:
+        conn.close()
     return downloaded
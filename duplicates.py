@@ -0,0 +1,123 @@
+# duplicates.py
+#
+# Duplicate finder for the Folder Inspector. Files are compared in tiers so most of them
+# are never read: same size first, then a hash of the first and last block, and a full
+# streamed hash only for what is still ambiguous. Hashes are cached in the upload store
+# by (device, inode, size, mtime), so a repeat scan only reads new or changed files.
+
+import os
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from model import config, content_hash
+import store
+
+EDGE_BLOCK = 64 * 1024
+
+
+def edge_hash(path, block_size=EDGE_BLOCK):
+    """
+    SHA-256 of the first and last block of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.read(block_size))
+        size = os.fstat(f.fileno()).st_size
+        if size > block_size:
+            f.seek(max(size - block_size, block_size))
+            digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+def _scan(folder_path):
+    # (path, size, dev, ino, mtime_ns) for every regular file under folder_path
+    found = []
+    stack = [folder_path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            if not st.st_ino:
+                                # DirEntry.stat() leaves the inode empty on Windows
+                                st = os.stat(entry.path)
+                            found.append((entry.path, st.st_size, st.st_dev, st.st_ino, st.st_mtime_ns))
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+    return found
+
+
+def _hash_tier(conn, files, kind, func, pool):
+    # Returns {path: hash}, using cached values and hashing the rest on the thread pool
+    hashes = {}
+    todo = []
+    for path, size, dev, ino, mtime in files:
+        cached = store.get_file_hash(conn, dev, ino, size, mtime, kind)
+        if cached:
+            hashes[path] = cached
+        else:
+            todo.append((path, size, dev, ino, mtime))
+    results = pool.map(lambda item: _safe_hash(func, item[0]), todo)
+    for (path, size, dev, ino, mtime), value in zip(todo, results):
+        if value:
+            hashes[path] = value
+            store.save_file_hash(conn, dev, ino, size, mtime, kind, value)
+    return hashes
+
+
+def _safe_hash(func, path):
+    try:
+        return func(path)
+    except OSError:
+        return None
+
+
+def _regroup(groups, hashes):
+    regrouped = defaultdict(list)
+    for key, files in groups.items():
+        for item in files:
+            if item[0] in hashes:
+                regrouped[(key, hashes[item[0]])].append(item)
+    return {key: files for key, files in regrouped.items() if len(files) > 1}
+
+
+def find_duplicates(folder_path, workers=None):
+    """
+    Finds files with identical contents under folder_path.
+
+    Returns:
+        A list of (duplicate, original) path pairs, original being the first file seen.
+    """
+    by_size = defaultdict(list)
+    seen_inodes = set()
+    for item in _scan(folder_path):
+        # Hard links share an inode: the same file, not a duplicate
+        if (item[2], item[3]) in seen_inodes:
+            continue
+        seen_inodes.add((item[2], item[3]))
+        by_size[item[1]].append(item)
+    candidates = {size: files for size, files in by_size.items() if len(files) > 1}
+
+    conn = store.connect(config["db_file"])
+    try:
+        with ThreadPoolExecutor(workers or config["hash_workers"]) as pool:
+            edge_files = [item for files in candidates.values() for item in files]
+            candidates = _regroup(candidates, _hash_tier(conn, edge_files, "edge", edge_hash, pool))
+            full_files = [item for files in candidates.values() for item in files]
+            candidates = _regroup(candidates, _hash_tier(conn, full_files, "full", content_hash, pool))
+    finally:
+        conn.close()
+
+    duplicates = []
+    for files in candidates.values():
+        files.sort()
+        original = files[0][0]
+        duplicates.extend((item[0], original) for item in files[1:])
+    return duplicates
@@ -0,0 +1,106 @@
+# entities.py
+#
+# Channel links and usernames resolved to input peers (id + access hash), kept in the
+# upload store. Resolving usernames and invite links is among the most rate-limited calls,
+# so a sheet's channels are resolved once, up front and paced, and later runs reuse the
+# cached peers until ENTITY_TTL_HOURS pass or a send reports the peer as invalid.
+
+import asyncio
+from datetime import timedelta
+from telethon import utils
+from telethon.errors import (
+    ChannelInvalidError, ChannelPrivateError, ChatIdInvalidError, PeerIdInvalidError,
+)
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+from model import config
+import store
+
+# RPC errors that mean a cached peer no longer works. Not ValueError: sends get an input
+# peer, so Telethon never resolves anything there, and its ValueErrors are local mistakes
+STALE_PEER_ERRORS = (ChannelInvalidError, ChannelPrivateError, ChatIdInvalidError, PeerIdInvalidError)
+
+
+def entity_key(channel):
+    """
+    Normalises a channel reference: t.me links, @names and bare usernames share one key.
+    Invite hashes keep their case; usernames do not have one.
+    """
+    key = str(channel).strip()
+    for prefix in ("https://", "http://"):
+        if key.lower().startswith(prefix):
+            key = key[len(prefix):]
+    for host in ("t.me/", "telegram.me/", "www.t.me/"):
+        if key.lower().startswith(host):
+            key = key[len(host):]
+    key = key.rstrip("/")
+    if key.startswith("+") or key.lower().startswith("joinchat/"):
+        return key
+    return key.lstrip("@").lower()
+
+
+def _to_input_peer(kind, peer_id, access_hash):
+    if kind == "channel":
+        return InputPeerChannel(peer_id, access_hash)
+    if kind == "chat":
+        return InputPeerChat(peer_id)
+    return InputPeerUser(peer_id, access_hash)
+
+
+def _save(conn, key, input_peer):
+    if isinstance(input_peer, InputPeerChannel):
+        store.save_entity(conn, key, "channel", input_peer.channel_id, input_peer.access_hash)
+    elif isinstance(input_peer, InputPeerChat):
+        store.save_entity(conn, key, "chat", input_peer.chat_id, None)
+    elif isinstance(input_peer, InputPeerUser):
+        store.save_entity(conn, key, "user", input_peer.user_id, input_peer.access_hash)
+
+
+def cached_entity(conn, channel):
+    row = store.get_entity(conn, entity_key(channel), timedelta(hours=config["entity_ttl_hours"]))
+    return _to_input_peer(*row) if row else None
+
+
+async def resolve_entity(client, scheduler, conn, channel):
+    """
+    Input peer for channel, from the store when resolved recently, otherwise from Telegram.
+    """
+    peer = cached_entity(conn, channel)
+    if peer is not None:
+        return peer
+    entity = await scheduler.run(channel, client.get_entity, channel)
+    peer = utils.get_input_peer(entity)
+    _save(conn, entity_key(channel), peer)
+    return peer
+
+
+def forget_entity(conn, channel):
+    store.drop_entity(conn, entity_key(channel))
+
+
+async def preresolve_entities(client, scheduler, conn, channels, logs):
+    """
+    Resolves every distinct channel not cached yet, one at a time with
+    RESOLVE_INTERVAL seconds between lookups (FloodWaits pause via scheduler).
+
+    Returns:
+        The entity_keys of channels that could not be resolved.
+    """
+    todo = {}
+    for channel in channels:
+        channel = str(channel).strip()
+        if channel and channel.lower() != "nan":
+            todo.setdefault(entity_key(channel), channel)
+    todo = [channel for channel in todo.values() if cached_entity(conn, channel) is None]
+
+    failed = set()
+    for i, channel in enumerate(todo):
+        if i:
+            await asyncio.sleep(config["resolve_interval"])
+        try:
+            await resolve_entity(client, scheduler, conn, channel)
+        except Exception as e:
+            failed.add(entity_key(channel))
+            logs.append(f"❌ Cannot access channel: {channel} | {e}")
+    if todo:
+        logs.append(f"🔎 Resolved {len(todo) - len(failed)} of {len(todo)} new channels")
+    return failed
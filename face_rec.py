@@ -2,7 +2,21 @@ import face_recognition
 import openpyxl
 import os
 import cv2
+import sys
+import time
 import shutil
+import hashlib
+import sqlite3
+import argparse
+import tempfile
+import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import hnswlib  # optional: approximate nearest-neighbour index for large identity sets
+except ImportError:
+    hnswlib = None
 
 # --- Configuration ---
 # You would need to create a directory with subdirectories for each person's reference image
@@ -22,18 +36,108 @@ EXCEL_FILE = "known_faces.xlsx"
 SORTED_FILES_DIR = "sorted_files"
 UNKNOWN_FACES_DIR = os.path.join(SORTED_FILES_DIR, "unidentified")
 TEMP_UPLOAD_DIR = "temp_uploads"
+ENCODINGS_CACHE = "known_faces_cache.npz"   # reference encodings, reused while the image mtime is unchanged
+MATCH_TOLERANCE = 0.6       # max face distance for a match, as in face_recognition.compare_faces
+ANN_MIN_IDENTITIES = 2000   # use an hnswlib index from this many identities, if hnswlib is installed
+VIDEO_SAMPLE_SECONDS = 5    # finest spacing between sampled video frames
+VIDEO_MAX_SAMPLES = 40      # frames checked before giving up on a video
+VIDEO_CONFIRMATIONS = 2     # stop as soon as one person is matched in this many frames
+FRAME_MAX_SIDE = 640        # video frames are shrunk to this longest side before detection
+IMAGE_MAX_SIDE = 1280       # images are shrunk to this longest side before detection, 0 keeps full size
+DETECTION_MODEL = "hog"     # "hog" (CPU) or "cnn" (accurate, needs a GPU build of dlib to be fast)
+FACE_CACHE_FILE = "face_cache.db"  # face encodings per file, keyed by content fingerprint
+FINGERPRINT_BLOCK = 64 * 1024
+IMAGE_TYPES = ('.jpg', '.jpeg', '.png')
+VIDEO_TYPES = ('.mp4', '.webm')
 
 # --- Main Logic ---
 
-def load_known_faces():
+class KnownFaces:
+    """
+    Known face encodings as one (identities x 128) matrix, matched by nearest neighbour.
+    """
+
+    def __init__(self, encodings, names, use_ann=None):
+        self.encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, 128)
+        self.names = list(names)
+        self._squared = (self.encodings ** 2).sum(axis=1)
+        self._index = None
+        if use_ann is None:
+            use_ann = hnswlib is not None and len(self.names) >= ANN_MIN_IDENTITIES
+        if use_ann:
+            if hnswlib is None:
+                raise ImportError("use_ann needs the hnswlib package")
+            self._index = hnswlib.Index(space="l2", dim=128)
+            self._index.init_index(max_elements=len(self.names), ef_construction=200, M=16)
+            self._index.add_items(self.encodings.astype(np.float32), np.arange(len(self.names)))
+            self._index.set_ef(64)
+        self.use_ann = self._index is not None
+
+    def __len__(self):
+        return len(self.names)
+
+    def nearest(self, face_encodings):
+        """
+        Index and distance of the closest known face for each of face_encodings.
+        """
+        faces = np.asarray(face_encodings, dtype=np.float64).reshape(-1, 128)
+        if self._index is not None:
+            labels, squared = self._index.knn_query(faces.astype(np.float32), k=1)
+            return labels[:, 0], np.sqrt(np.maximum(squared[:, 0], 0))
+        # |a - b|^2 = |a|^2 + |b|^2 - 2ab for every face/identity pair in one product
+        squared = (faces ** 2).sum(axis=1)[:, None] + self._squared[None, :] - 2 * faces @ self.encodings.T
+        best = squared.argmin(axis=1)
+        return best, np.sqrt(np.maximum(squared[np.arange(len(faces)), best], 0))
+
+    def match(self, face_encodings, tolerance=MATCH_TOLERANCE):
+        """
+        Name of the known face closest to any of face_encodings, or None if none is within tolerance.
+        """
+        if not len(self.names) or not len(face_encodings):
+            return None
+        best, distances = self.nearest(face_encodings)
+        face = int(distances.argmin())
+        return self.names[best[face]] if distances[face] <= tolerance else None
+
+
+def _load_encoding_cache():
+    # image path -> (mtime, encoding)
+    try:
+        with np.load(ENCODINGS_CACHE, allow_pickle=False) as data:
+            return {
+                path: (mtime, encoding)
+                for path, mtime, encoding in zip(data["paths"].tolist(), data["mtimes"], data["encodings"])
+            }
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def _save_encoding_cache(cache):
+    paths = list(cache)
+    partial = ENCODINGS_CACHE + ".part.npz"
+    np.savez(
+        partial,
+        paths=np.array(paths, dtype=str),
+        mtimes=np.array([cache[p][0] for p in paths], dtype=np.float64),
+        encodings=np.array([cache[p][1] for p in paths], dtype=np.float64).reshape(-1, 128),
+    )
+    os.replace(partial, ENCODINGS_CACHE)
+
+
+def load_known_faces(use_ann=None):
     """
     Loads known face encodings and names from an Excel sheet.
-    
+
+    Reference images are only decoded and encoded when they are new or their mtime
+    changed since the last run; the rest come from ENCODINGS_CACHE.
+
     Returns:
-        A tuple of two lists: known_face_encodings and known_face_names.
+        A KnownFaces with one row per reference image that contains a face.
     """
     known_face_encodings = []
     known_face_names = []
+    cache = _load_encoding_cache()
+    fresh = {}
 
     try:
         workbook = openpyxl.load_workbook(EXCEL_FILE)
@@ -41,15 +145,21 @@ def load_known_faces():
         print(f"Loading known faces from '{EXCEL_FILE}'...")
 
         for row in sheet.iter_rows(min_row=2, values_only=True):
-            name, image_path = row
+            name, image_path = row[:2]
             if name and image_path:
                 try:
-                    # Load the image and get the face encoding
-                    image = face_recognition.load_image_file(image_path)
-                    face_encoding = face_recognition.face_encodings(image)[0]
+                    mtime = os.path.getmtime(image_path)
+                    cached = cache.get(image_path)
+                    if cached is not None and cached[0] == mtime:
+                        face_encoding = cached[1]
+                    else:
+                        # Load the image and get the face encoding
+                        image = face_recognition.load_image_file(image_path)
+                        face_encoding = face_recognition.face_encodings(image)[0]
+                        print(f"Loaded face for: {name}")
+                    fresh[image_path] = (mtime, face_encoding)
                     known_face_encodings.append(face_encoding)
                     known_face_names.append(name)
-                    print(f"Loaded face for: {name}")
                 except IndexError:
                     print(f"Warning: No face found in image for {name} at {image_path}")
                 except FileNotFoundError:
@@ -57,85 +167,334 @@ def load_known_faces():
 
     except FileNotFoundError:
         print(f"Error: The Excel file '{EXCEL_FILE}' was not found.")
-    
-    return known_face_encodings, known_face_names
 
-def process_image(image_path, known_encodings, known_names):
+    if fresh.keys() != cache.keys() or any(fresh[p][0] != cache[p][0] for p in fresh):
+        _save_encoding_cache(fresh)
+    return KnownFaces(known_face_encodings, known_face_names, use_ann)
+
+def image_face_encodings(image_path, model=DETECTION_MODEL, max_side=IMAGE_MAX_SIDE):
+    image = _downscale(face_recognition.load_image_file(image_path), max_side)
+    face_locations = face_recognition.face_locations(image, model=model)
+    return face_recognition.face_encodings(image, face_locations)
+
+
+def process_image(image_path, known, model=DETECTION_MODEL, max_side=IMAGE_MAX_SIDE):
     """
     Processes an image file to find and identify faces.
+    The image is shrunk to max_side before detection.
     
     Returns:
         The name of the identified person, or None if no match is found.
     """
     print(f"Processing image: {image_path}")
     try:
-        image = face_recognition.load_image_file(image_path)
-        face_locations = face_recognition.face_locations(image)
-        face_encodings = face_recognition.face_encodings(image, face_locations)
-
-        for face_encoding in face_encodings:
-            matches = face_recognition.compare_faces(known_encodings, face_encoding)
-            name = "Unknown"
-
-            if True in matches:
-                first_match_index = matches.index(True)
-                name = known_names[first_match_index]
-                return name
+        return known.match(image_face_encodings(image_path, model, max_side))
     except Exception as e:
         print(f"Error processing image {image_path}: {e}")
     
     return None
 
-def process_video(video_path, known_encodings, known_names):
+def sample_times(duration, min_gap=VIDEO_SAMPLE_SECONDS, max_samples=VIDEO_MAX_SAMPLES):
     """
-    Processes a video file to find and identify faces in frames.
-    
+    Timestamps (seconds) from coarse to fine: the middle, then the quarters, the eighths
+    and so on down to min_gap apart, so the first few samples already span the video.
+    """
+    times = []
+    parts = 2
+    while len(times) < max_samples and (parts == 2 or duration / parts >= min_gap):
+        times.extend(duration * i / parts for i in range(1, parts, 2))
+        parts *= 2
+    return times[:max_samples]
+
+
+def _sampled_frames(capture):
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0
+    frame_count = capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+    if fps > 0 and frame_count > 0:
+        # Seeking jumps to the nearest keyframe, so skipped stretches are never decoded
+        for t in sample_times(frame_count / fps):
+            capture.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
+            ret, frame = capture.read()
+            if ret:
+                yield frame
+        return
+    # No usable FPS or length: step through with grab(), retrieving only sampled frames
+    step = max(int((fps or 25) * VIDEO_SAMPLE_SECONDS), 1)
+    index = taken = 0
+    while taken < VIDEO_MAX_SAMPLES and capture.grab():
+        if index % step == 0:
+            ret, frame = capture.retrieve()
+            if ret:
+                taken += 1
+                yield frame
+        index += 1
+
+
+def _downscale(frame, max_side):
+    height, width = frame.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return frame
+    scale = max_side / max(height, width)
+    return cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def video_face_encodings(video_path, model=DETECTION_MODEL, max_side=FRAME_MAX_SIDE):
+    """
+    Yields the face encodings found in each sampled frame.
+    """
+    video_capture = cv2.VideoCapture(video_path)
+    try:
+        for frame in _sampled_frames(video_capture):
+            rgb_frame = cv2.cvtColor(_downscale(frame, max_side), cv2.COLOR_BGR2RGB)
+            face_locations = face_recognition.face_locations(rgb_frame, model=model)
+            yield face_recognition.face_encodings(rgb_frame, face_locations)
+    finally:
+        video_capture.release()
+
+
+def vote(frames, known):
+    """
+    Matches per-frame encodings until one person is seen in VIDEO_CONFIRMATIONS frames.
+
+    Returns:
+        (name or None, whether it stopped early on a confirmed match); without a
+        confirmation the person matched most often wins.
+    """
+    votes = Counter()
+    for face_encodings in frames:
+        name = known.match(face_encodings)
+        if name:
+            votes[name] += 1
+            if votes[name] >= VIDEO_CONFIRMATIONS:
+                return name, True
+    return (votes.most_common(1)[0][0] if votes else None), False
+
+
+def process_video(video_path, known, model=DETECTION_MODEL, max_side=FRAME_MAX_SIDE):
+    """
+    Processes a video file to find and identify faces in sampled frames.
+
     Returns:
         The name of the identified person, or None if no match is found.
     """
     print(f"Processing video: {video_path}")
-    video_capture = cv2.VideoCapture(video_path)
-    frame_rate = video_capture.get(cv2.CAP_PROP_FPS)
-    frame_interval = int(frame_rate * 5) # Check every 5 seconds
-
-    frame_count = 0
-    while video_capture.isOpened():
-        ret, frame = video_capture.read()
-        if not ret:
-            break
-
-        if frame_count % frame_interval == 0:
-            # Process frame if it's at the desired interval
-            rgb_frame = frame[:, :, ::-1] # Convert BGR to RGB
-            face_locations = face_recognition.face_locations(rgb_frame)
-            face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-            for face_encoding in face_encodings:
-                matches = face_recognition.compare_faces(known_encodings, face_encoding)
-                if True in matches:
-                    first_match_index = matches.index(True)
-                    name = known_names[first_match_index]
-                    print(f"Face recognized in video frame: {name}")
-                    video_capture.release()
-                    return name
-        
-        frame_count += 1
-
-    video_capture.release()
-    return None
+    frames = video_face_encodings(video_path, model, max_side)
+    try:
+        name, _ = vote(frames, known)
+    finally:
+        frames.close()
+    if name:
+        print(f"Face recognized in video frame: {name}")
+    return name
+
+
+def file_fingerprint(path, block_size=FINGERPRINT_BLOCK):
+    """
+    SHA-256 of a file's size and its first, middle and last blocks; survives moves and renames.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(str(size).encode())
+        for offset in sorted({0, max(size // 2 - block_size // 2, 0), max(size - block_size, 0)}):
+            f.seek(offset)
+            digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+class EncodingCache:
+    """
+    Face encodings found in each file, keyed by content fingerprint and detection settings,
+    so a changed known-faces sheet only needs a re-match, not another detection pass.
+    """
+
+    def __init__(self, db_file=FACE_CACHE_FILE):
+        self.conn = sqlite3.connect(db_file, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS face_encodings ("
+            " key TEXT PRIMARY KEY, counts BLOB NOT NULL, encodings BLOB NOT NULL, complete INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+
+    def get(self, key):
+        """
+        Returns (per-frame encodings, complete) or None. complete is False when a video
+        was cut short by an early match and frames after it were never examined.
+        """
+        row = self.conn.execute(
+            "SELECT counts, encodings, complete FROM face_encodings WHERE key = ?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        counts = np.frombuffer(row[0], dtype=np.int32)
+        encodings = np.frombuffer(row[1], dtype=np.float64).reshape(-1, 128)
+        return np.split(encodings, np.cumsum(counts)[:-1]), bool(row[2])
+
+    def put(self, key, frames, complete):
+        counts = np.array([len(face_encodings) for face_encodings in frames], dtype=np.int32)
+        encodings = np.array([e for face_encodings in frames for e in face_encodings], dtype=np.float64)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO face_encodings VALUES (?, ?, ?, ?)",
+                (key, counts.tobytes(), encodings.tobytes(), int(complete)),
+            )
+
+
+def _classify_cached(file_path, known, cache, model, max_side):
+    file_ext = os.path.splitext(file_path)[1].lower()
+    key = f"{file_fingerprint(file_path)}:{model}:{max_side if file_ext in IMAGE_TYPES else FRAME_MAX_SIDE}"
+    cached = cache.get(key)
+    if cached:
+        frames, complete = cached
+        name, confirmed = vote(frames, known)
+        if confirmed or complete:
+            return name
+
+    print(f"Processing: {file_path}")
+    if file_ext in IMAGE_TYPES:
+        frames = [image_face_encodings(file_path, model, max_side)]
+        cache.put(key, frames, True)
+        return known.match(frames[0])
+
+    frames = []
+
+    def recorded():
+        for face_encodings in video_face_encodings(file_path, model):
+            frames.append(face_encodings)
+            yield face_encodings
+
+    name, confirmed = vote(recorded(), known)
+    cache.put(key, frames, not confirmed)
+    return name
+
+
+def classify_file(file_path, known, model=DETECTION_MODEL, max_side=IMAGE_MAX_SIDE, cache=None):
+    """
+    With a cache, files seen before (by content) are only re-matched against known.
+
+    Returns:
+        The person in the file, None if no known face was found, or "unidentified"
+        for unsupported file types.
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
+    if file_ext not in IMAGE_TYPES + VIDEO_TYPES:
+        print(f"Skipping unsupported file type: {os.path.basename(file_path)}")
+        return "unidentified"
+    if cache is None:
+        if file_ext in IMAGE_TYPES:
+            return process_image(file_path, known, model, max_side)
+        return process_video(file_path, known, model)
+    try:
+        return _classify_cached(file_path, known, cache, model, max_side)
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return None
+
+
+# Set once per pool process by _init_worker
+_worker_known = None
+_worker_options = {}
+
+
+def _init_worker(encodings, names, use_ann, options, cache_file):
+    global _worker_known
+    cv2.setNumThreads(1)    # one process per core already; avoid oversubscribing
+    _worker_known = KnownFaces(encodings, names, use_ann)
+    _worker_options.update(options, cache=EncodingCache(cache_file) if cache_file else None)
+
+
+def _classify_in_worker(file_path):
+    try:
+        return file_path, classify_file(file_path, _worker_known, **_worker_options)
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return file_path, None
+
+
+def classify_files(file_paths, known, workers=None, model=DETECTION_MODEL, max_side=IMAGE_MAX_SIDE, cache_file=FACE_CACHE_FILE):
+    """
+    Classifies files on a process pool; each worker builds the known-face matrix once.
+    cache_file=None turns off the per-file encoding cache.
+
+    Yields:
+        (file_path, person name or None) as each file finishes, in completion order.
+    """
+    options = {"model": model, "max_side": max_side}
+    if workers == 1:
+        cache = EncodingCache(cache_file) if cache_file else None
+        for file_path in file_paths:
+            yield file_path, classify_file(file_path, known, cache=cache, **options)
+        return
+    initargs = (known.encodings, known.names, known.use_ann, options, cache_file)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool:
+        futures = [pool.submit(_classify_in_worker, file_path) for file_path in file_paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def make_synthetic_images(folder, count, size=(1920, 1080), seed=0):
+    """
+    Writes count noisy JPEGs with random shapes to folder, for benchmarking detection.
+    """
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        image = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        image = cv2.GaussianBlur(image, (0, 0), 3)
+        for _ in range(5):
+            center = (int(rng.integers(0, size[0])), int(rng.integers(0, size[1])))
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            cv2.circle(image, center, int(rng.integers(20, 200)), color, -1)
+        path = os.path.join(folder, f"synthetic_{i:05d}.jpg")
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def benchmark(count=100, workers=None, model=DETECTION_MODEL, max_side=IMAGE_MAX_SIDE):
+    """
+    Classifies a synthetic image set in this process at full size, then with the pool
+    and downscaling.
+
+    Returns:
+        A dict of files/s for the "single" and "pool" runs.
+    """
+    known = load_known_faces()
+    with tempfile.TemporaryDirectory(prefix="face_bench_") as folder:
+        paths = make_synthetic_images(folder, count)
+
+        start = time.perf_counter()
+        for _ in classify_files(paths, known, workers=1, model=model, max_side=0, cache_file=None):
+            pass
+        single = count / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in classify_files(paths, known, workers, model, max_side, cache_file=None):
+            pass
+        pool = count / (time.perf_counter() - start)
+
+    return {"single": single, "pool": pool}
+
 
 def sort_file(file_path, person_name):
     """
     Moves a file to the appropriate person's folder.
     """
     target_dir = os.path.join(SORTED_FILES_DIR, person_name)
+    if os.path.dirname(os.path.abspath(file_path)) == os.path.abspath(target_dir):
+        return
     os.makedirs(target_dir, exist_ok=True)
     
     shutil.move(file_path, target_dir)
     print(f"File '{os.path.basename(file_path)}' sorted to '{target_dir}'")
 
-def main():
+def main(workers=None, model=DETECTION_MODEL, max_side=IMAGE_MAX_SIDE, cache_file=FACE_CACHE_FILE, resort=False):
     """
     Main function to run the file processing and sorting logic.
+    Files are classified on a pool of workers and sorted as each one finishes.
+    With resort, files already in SORTED_FILES_DIR are classified again (from the
+    encoding cache where possible) and moved if their person changed.
     
     Note: This is a conceptual script. In a real application, a web server
     (like Flask) would handle file uploads and pass the file paths to this
@@ -144,40 +503,45 @@ def main():
     os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
     os.makedirs(UNKNOWN_FACES_DIR, exist_ok=True)
 
-    # Simulate some files being uploaded
-    # You would replace this with actual logic to handle files uploaded by users.
-    print(f"Simulating file uploads to '{TEMP_UPLOAD_DIR}'...")
-    # Example: Create dummy files for demonstration
-    with open(os.path.join(TEMP_UPLOAD_DIR, "test_image.jpg"), "w") as f:
-        f.write("dummy content")
-    with open(os.path.join(TEMP_UPLOAD_DIR, "test_video.mp4"), "w") as f:
-        f.write("dummy content")
+    if not resort:
+        # Simulate some files being uploaded
+        # You would replace this with actual logic to handle files uploaded by users.
+        print(f"Simulating file uploads to '{TEMP_UPLOAD_DIR}'...")
+        # Example: Create dummy files for demonstration
+        with open(os.path.join(TEMP_UPLOAD_DIR, "test_image.jpg"), "w") as f:
+            f.write("dummy content")
+        with open(os.path.join(TEMP_UPLOAD_DIR, "test_video.mp4"), "w") as f:
+            f.write("dummy content")
     
     # 1. Load the known faces
-    known_face_encodings, known_face_names = load_known_faces()
-    if not known_face_encodings:
+    known = load_known_faces()
+    if not len(known):
         print("No known faces loaded. Exiting.")
         return
 
-    # 2. Process the uploaded files
-    for filename in os.listdir(TEMP_UPLOAD_DIR):
-        file_path = os.path.join(TEMP_UPLOAD_DIR, filename)
-        file_ext = os.path.splitext(filename)[1].lower()
-        
-        person_name = None
-        if file_ext in ['.jpg', '.jpeg', '.png']:
-            person_name = process_image(file_path, known_face_encodings, known_face_names)
-        elif file_ext in ['.mp4', '.webm']:
-            person_name = process_video(file_path, known_face_encodings, known_face_names)
-        else:
-            print(f"Skipping unsupported file type: {filename}")
-            person_name = "unidentified"
-
-        # 3. Sort the file
-        if person_name:
-            sort_file(file_path, person_name)
-        else:
-            sort_file(file_path, "unidentified")
-
-if name == "main":
-    main()
\ No newline at end of file
+    # 2. Process the uploaded files and 3. sort each one as its result comes in
+    if resort:
+        file_paths = [os.path.join(root, name) for root, _, names in os.walk(SORTED_FILES_DIR) for name in names]
+    else:
+        file_paths = [os.path.join(TEMP_UPLOAD_DIR, filename) for filename in os.listdir(TEMP_UPLOAD_DIR)]
+    for file_path, person_name in classify_files(file_paths, known, workers, model, max_side, cache_file):
+        sort_file(file_path, person_name or "unidentified")
+
+if __name__ == "__main__":
+    # python face_rec.py [--workers N] [--model hog|cnn] [--max-side PX] [--no-cache] [--resort] [--benchmark IMAGES]
+    parser = argparse.ArgumentParser(description="Sort files into folders by the known faces in them.")
+    parser.add_argument("--workers", type=int, default=None, help="classifier processes (default: one per CPU)")
+    parser.add_argument("--model", choices=["hog", "cnn"], default=DETECTION_MODEL, help="face detection model")
+    parser.add_argument("--max-side", type=int, default=IMAGE_MAX_SIDE, help="shrink images to this longest side, 0 for full size")
+    parser.add_argument("--no-cache", action="store_true", help="detect faces again instead of using the per-file encoding cache")
+    parser.add_argument("--resort", action="store_true", help=f"re-classify files already sorted into {SORTED_FILES_DIR}")
+    parser.add_argument("--benchmark", type=int, metavar="IMAGES", help="time classification of a synthetic image set instead of sorting")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        result = benchmark(args.benchmark, args.workers, args.model, args.max_side)
+        print(f"Single process, full size : {result['single']:.2f} files/s")
+        print(f"Pool, downscaled          : {result['pool']:.2f} files/s")
+        print(f"Speed-up                  : {result['pool'] / result['single']:.1f}x")
+        sys.exit(0)
+    main(args.workers, args.model, args.max_side, None if args.no_cache else FACE_CACHE_FILE, args.resort)
\ No newline at end of file
@@ -0,0 +1,222 @@
+# fast_upload.py
+
+import os
+import sys
+import time
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from telethon import TelegramClient, helpers, utils
+from telethon.errors import FloodWaitError
+from telethon.network import MTProtoSender
+from telethon.tl.functions.upload import SaveBigFilePartRequest
+from telethon.tl.types import InputFileBig, InputMediaUploadedDocument
+import store
+
+# Telegram only accepts SaveBigFilePart for files above 10 MB
+BIG_FILE_SIZE = 10 * 1024 * 1024
+MAX_PART_SIZE_KB = 512
+# Telegram discards parts of uploads that are never finished, so older progress is not trusted
+RESUME_MAX_AGE = timedelta(hours=12)
+
+
+def is_large_file(path_or_file, threshold_mb):
+    """
+    True when the file should go through the parallel upload path.
+    """
+    threshold = max(threshold_mb * 1024 * 1024, BIG_FILE_SIZE + 1)
+    return _file_size(path_or_file) >= threshold
+
+
+def _file_size(path_or_file):
+    if isinstance(path_or_file, str):
+        return os.path.getsize(path_or_file)
+    size = getattr(path_or_file, "size", None)
+    if size is None:
+        pos = path_or_file.tell()
+        size = path_or_file.seek(0, os.SEEK_END)
+        path_or_file.seek(pos)
+    return size
+
+
+def source_fingerprint(path, sample_size=64 * 1024):
+    """
+    Cheap identity of a file on disk: size, mtime and a hash of its first and last blocks.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.read(sample_size))
+        f.seek(max(stat.st_size - sample_size, 0))
+        digest.update(f.read(sample_size))
+    return f"{stat.st_size}:{stat.st_mtime_ns}:{digest.hexdigest()}"
+
+
+def _resume_state(conn, source, fingerprint, part_size, part_count):
+    # Returns (file_id, parts) to continue from, or None to start over
+    saved = store.get_upload_progress(conn, source)
+    if not saved:
+        return None
+    saved_fingerprint, file_id, saved_part_size, saved_part_count, parts, updated_at = saved
+    if (saved_fingerprint != fingerprint or saved_part_size != part_size or saved_part_count != part_count
+            or datetime.now() - datetime.fromisoformat(updated_at) > RESUME_MAX_AGE):
+        store.clear_upload_progress(conn, source)
+        return None
+    return file_id, bytearray(parts)
+
+
+async def _create_sender(client):
+    # Each sender needs its own connection; reusing client._sender's would clash on seqno
+    dc = await client._get_dc(client.session.dc_id)
+    sender = MTProtoSender(client.session.auth_key, loggers=client._log)
+    await sender.connect(client._connection(
+        dc.ip_address,
+        dc.port,
+        dc.id,
+        loggers=client._log,
+        proxy=client._proxy,
+        local_addr=client._local_addr,
+    ))
+    return sender
+
+
+async def upload_file(client, path_or_file, part_size_kb=512, workers=8, progress_callback=None, conn=None):
+    """
+    Uploads a large file over several sender connections at once.
+
+    Accepts a path or a seekable binary file object (e.g. a Streamlit UploadedFile).
+    With a store connection and a path, every acknowledged part is saved so a later
+    call continues where a crashed run stopped, unless the source has changed since.
+
+    Returns:
+        An InputFileBig handle that can be passed straight to client.send_file.
+    """
+    part_size_kb = int(part_size_kb)
+    if part_size_kb > MAX_PART_SIZE_KB or (MAX_PART_SIZE_KB % part_size_kb) != 0:
+        raise ValueError("The part size must divide 512KB evenly")
+    part_size = part_size_kb * 1024
+
+    file_size = _file_size(path_or_file)
+    if file_size <= BIG_FILE_SIZE:
+        raise ValueError("Parallel upload is only used for files larger than 10MB")
+
+    if isinstance(path_or_file, str):
+        stream = open(path_or_file, "rb")
+        file_name = os.path.basename(path_or_file)
+    else:
+        stream = path_or_file
+        file_name = os.path.basename(getattr(path_or_file, "name", "") or "")
+
+    part_count = (file_size + part_size - 1) // part_size
+    resumable = conn is not None and isinstance(path_or_file, str)
+    state = None
+    if resumable:
+        source = os.path.abspath(path_or_file)
+        fingerprint = source_fingerprint(path_or_file)
+        state = _resume_state(conn, source, fingerprint, part_size, part_count)
+    if state:
+        file_id, parts = state
+    else:
+        file_id, parts = helpers.generate_random_long(), bytearray(part_count)
+    file_name = file_name or str(file_id)
+
+    next_part = iter([i for i in range(part_count) if not parts[i]])
+    read_lock = asyncio.Lock()
+    uploaded = sum(1 for done in parts if done) * part_size
+
+    async def read_part(index):
+        async with read_lock:
+            stream.seek(index * part_size)
+            return stream.read(part_size)
+
+    async def worker(sender):
+        nonlocal uploaded
+        for index in next_part:
+            data = await read_part(index)
+            while True:
+                try:
+                    result = await sender.send(SaveBigFilePartRequest(file_id, index, part_count, data))
+                    break
+                except FloodWaitError as e:
+                    await asyncio.sleep(e.seconds)
+            if not result:
+                raise RuntimeError(f"Failed to upload file part {index}")
+            parts[index] = 1
+            if resumable:
+                store.save_upload_progress(conn, source, fingerprint, file_id, part_size, part_count, parts)
+            uploaded += len(data)
+            if progress_callback:
+                await helpers._maybe_await(progress_callback(uploaded, file_size))
+
+    senders = []
+    try:
+        for _ in range(max(1, min(int(workers), part_count - sum(parts)))):
+            senders.append(await _create_sender(client))
+        tasks = [asyncio.ensure_future(worker(sender)) for sender in senders]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop the other workers before the stream and senders below go away, so none
+            # keeps reading or saves parts into the progress of a later attempt
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    finally:
+        for sender in senders:
+            await sender.disconnect()
+        if stream is not path_or_file:
+            stream.close()
+
+    return InputFileBig(file_id, part_count, file_name)
+
+
+def uploaded_document(handle, path_or_file):
+    """
+    Media for an already uploaded handle, with the document attributes (file name,
+    video duration and size) and MIME type read from the source file. Telethon cannot
+    read these back from an InputFileBig, and would guess them from the name alone.
+    Large files always go as documents: they are over the size limit for photos.
+    """
+    attributes, mime_type = utils.get_attributes(path_or_file, supports_streaming=True)
+    return InputMediaUploadedDocument(handle, mime_type or "application/octet-stream", attributes)
+
+
+async def benchmark_upload(client, path, part_size_kb=512, workers=8):
+    """
+    Uploads the same file with client.upload_file and with the parallel engine.
+
+    Returns:
+        A dict of MB/s for the "single" and "parallel" paths.
+    """
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+
+    start = time.perf_counter()
+    await client.upload_file(path, part_size_kb=part_size_kb)
+    single = size_mb / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await upload_file(client, path, part_size_kb=part_size_kb, workers=workers)
+    parallel = size_mb / (time.perf_counter() - start)
+
+    return {"single": single, "parallel": parallel}
+
+
+if __name__ == "__main__":
+    # python fast_upload.py <big file> [workers]
+    from model import config
+
+    async def main():
+        path = sys.argv[1]
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else config["upload_workers"]
+        client = TelegramClient(config["session_name"], config["api_id"], config["api_hash"])
+        await client.start(phone=config["phone"])
+        try:
+            result = await benchmark_upload(client, path, config["upload_part_size_kb"], workers)
+        finally:
+            await client.disconnect()
+        print(f"Single stream : {result['single']:.2f} MB/s")
+        print(f"Parallel ({workers}) : {result['parallel']:.2f} MB/s")
+        print(f"Speed-up      : {result['parallel'] / result['single']:.1f}x")
+
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+# fs_index.py
+#
+# Shared index of file counts and byte totals per directory, saved to disk between runs.
+# A refresh stats every directory once but only lists directories whose mtime changed,
+# so metrics for a large tree do not cost one stat per file on every page render.
+# Directory mtimes change when entries are added, removed or renamed; a file rewritten
+# in place keeps its old size in the index until its directory changes.
+
+import os
+import json
+import time
+import threading
+
+_index = {}     # directory -> [mtime_ns, files, bytes, subdirectory names]
+_totals = {}    # root -> (monotonic time, entries, files, bytes)
+_state = {"loaded_from": None, "dirty": False}
+_lock = threading.Lock()
+
+
+def _load(index_file):
+    if _state["loaded_from"] == index_file:
+        return
+    _index.clear()
+    _totals.clear()
+    try:
+        with open(index_file, "r", encoding="utf-8") as f:
+            _index.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    _state["loaded_from"] = index_file
+
+
+def _save(index_file):
+    if not _state["dirty"]:
+        return
+    os.makedirs(os.path.dirname(index_file) or ".", exist_ok=True)
+    partial = index_file + ".part"
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump(_index, f)
+    os.replace(partial, index_file)
+    _state["dirty"] = False
+
+
+def _scan_dir(path):
+    files = size = 0
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file(follow_symlinks=False):
+                    files += 1
+                    size += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                pass
+    return files, size, subdirs
+
+
+def _refresh(path, visited):
+    # Returns (files, bytes) under path, listing only directories that changed
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return 0, 0
+    visited.add(path)
+    cached = _index.get(path)
+    if cached is None or cached[0] != mtime:
+        try:
+            files, size, subdirs = _scan_dir(path)
+        except OSError:
+            return 0, 0
+        cached = _index[path] = [mtime, files, size, subdirs]
+        _state["dirty"] = True
+    files, size = cached[1], cached[2]
+    for name in cached[3]:
+        sub_files, sub_size = _refresh(os.path.join(path, name), visited)
+        files += sub_files
+        size += sub_size
+    return files, size
+
+
+def folder_stats(root, index_file, max_age=30):
+    """
+    Entry count of root itself, plus files and bytes in the whole tree under it.
+
+    Results younger than max_age seconds are returned without touching the disk.
+
+    Returns:
+        (entries, files, bytes); all zero if root does not exist.
+    """
+    root = os.path.abspath(root)
+    with _lock:
+        _load(index_file)
+        cached = _totals.get(root)
+        if cached and time.monotonic() - cached[0] < max_age:
+            return cached[1:]
+        if not os.path.isdir(root):
+            return 0, 0, 0
+
+        visited = set()
+        files, size = _refresh(root, visited)
+        # Forget directories under root that no longer exist
+        prefix = root.rstrip(os.sep) + os.sep
+        for path in [p for p in _index if p.startswith(prefix) and p not in visited]:
+            del _index[path]
+            _state["dirty"] = True
+
+        entry = _index.get(root)
+        if entry is None:
+            return 0, 0, 0
+        entries = entry[1] + len(entry[3])
+        _totals[root] = (time.monotonic(), entries, files, size)
+        _save(index_file)
+        return entries, files, size
@@ -2,7 +2,7 @@
 
 import os
 import shutil
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from telethon import TelegramClient
 from telethon.errors import FloodWaitError
 from telethon.tl.types import DocumentAttributeFilename, MessageMediaPhoto
@@ -10,7 +10,12 @@ import asyncio
 import pandas as pd
 from PIL import Image
 # import pillow_heif
-import tempfile
+import hashlib
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import threading
+import store
+from fs_index import folder_stats
 
 # === Dynamic Base Directory (project root) ===
 # BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -31,112 +36,442 @@ config = {
     "base_path": os.getenv("BASE_PATH", os.path.join(BASE_DIR, "data")),   # default "data" folder
     "log_file": os.path.join(BASE_DIR, "logs", "upload_log.csv"),
     "temp_log_file": "F:/Telegram Dashboard/telegram_dashboard/Telegram-Uploader/Log File/temp_upload_log.csv",
-    "cache_file": os.path.join(BASE_DIR, "logs", "uploaded_cache.txt"),
-    "temp_cache_file": "F:/Telegram Dashboard/telegram_dashboard/Telegram-Uploader/Log File/temp_uploaded_cache.txt"
+    "cache_file": os.path.join(BASE_DIR, "logs", "uploaded_cache.txt"),   # legacy, imported into db_file
+    "db_file": os.path.join(BASE_DIR, "logs", "uploads.db"),
+    "temp_cache_file": "F:/Telegram Dashboard/telegram_dashboard/Telegram-Uploader/Log File/temp_uploaded_cache.txt",
+    "upload_concurrency": int(os.getenv("UPLOAD_CONCURRENCY", "4")),   # sends in flight across all channels
+    "channel_concurrency": int(os.getenv("CHANNEL_CONCURRENCY", "1")),  # sends in flight per channel
+    "large_file_mb": int(os.getenv("LARGE_FILE_MB", "20")),             # files from this size use parallel parts
+    "upload_workers": int(os.getenv("UPLOAD_WORKERS", "8")),            # sender connections per large file
+    "upload_part_size_kb": int(os.getenv("UPLOAD_PART_SIZE_KB", "512")),
+    "resumable_uploads": os.getenv("RESUMABLE_UPLOADS", "1") == "1",    # persist part progress of large files
+    "worker_concurrency": int(os.getenv("WORKER_CONCURRENCY", "3")),    # jobs the background worker runs at once
+    "jobs_dir": os.path.join(BASE_DIR, "jobs"),                         # files queued from Mobile Upload
+    "convert_cache_dir": os.path.join(BASE_DIR, "convert_cache"),      # .heic/.webp converted to JPG
+    "convert_cache_mb": int(os.getenv("CONVERT_CACHE_MB", "2048")),     # scratch disk kept for conversions
+    "convert_workers": int(os.getenv("CONVERT_WORKERS", str(os.cpu_count() or 2))),
+    "group_max_mb": int(os.getenv("GROUP_MAX_MB", "0")),                # byte cap per media group, 0 = no cap
+    "download_workers": int(os.getenv("DOWNLOAD_WORKERS", "4")),        # media downloaded at once per channel
+    "fs_index_file": os.path.join(BASE_DIR, "logs", "fs_index.json"),   # per-directory file counts and sizes
+    "fs_index_ttl": int(os.getenv("FS_INDEX_TTL", "30")),               # seconds before folder metrics are rechecked
+    "hash_workers": int(os.getenv("HASH_WORKERS", "4")),                # threads hashing files for uploads and duplicate search
+    "near_dup_radius": int(os.getenv("NEAR_DUP_RADIUS", "0")),          # max differing bits (of 64) for a near-duplicate, 0 disables
+    "place_workers": int(os.getenv("PLACE_WORKERS", "8")),              # threads placing files on the Separate Files page
+    "zip_workers": int(os.getenv("ZIP_WORKERS", str(os.cpu_count() or 4))),  # threads compressing files for Zip Folder
+    "watch_sheet": os.getenv("WATCH_SHEET", os.path.join(BASE_DIR, "TelegramChannel.xlsx")),  # sheet watcher.py follows
+    "watch_settle_seconds": float(os.getenv("WATCH_SETTLE_SECONDS", "2")),  # unchanged this long = done writing
+    "watch_batch_seconds": float(os.getenv("WATCH_BATCH_SECONDS", "1")),    # quiet time before a folder's batch is sent
+    "client_connections": int(os.getenv("CLIENT_CONNECTIONS", "2")),    # pooled Telegram connections per session
+    "client_health_seconds": int(os.getenv("CLIENT_HEALTH_SECONDS", "60")),  # ping interval for idle pooled clients
+    "entity_ttl_hours": int(os.getenv("ENTITY_TTL_HOURS", "168")),      # reuse resolved channel peers this long
+    "resolve_interval": float(os.getenv("RESOLVE_INTERVAL", "1"))       # seconds between channel lookups when pre-resolving
 }
 
 # Make sure required directories exist
 for path in [
     os.path.dirname(config["session_name"]),
     os.path.dirname(config["log_file"]),
+    config["convert_cache_dir"],
     config["base_path"]
 ]:
     os.makedirs(path, exist_ok=True)
 
 # === Helper Functions ===
-def load_metrics(base_path, cache_file):
-    folders = len(os.listdir(base_path)) if os.path.exists(base_path) else 0
-    files = sum(len(f) for _, _, f in os.walk(base_path)) if os.path.exists(base_path) else 0
-    uploads = len(open(cache_file).readlines()) if os.path.exists(cache_file) else 0
+def load_metrics(base_path, db_file):
+    folders, files, _ = folder_stats(base_path, config["fs_index_file"], config["fs_index_ttl"])
+    uploads = store.count_uploads(db_file)
     return folders, files, uploads
 
-def load_logs(log_file):
-    if os.path.exists(log_file):
+ROLLUP_NAMES = {"day": "Date", "channel": "Channel", "file_type": "FileType"}
+
+def open_log_store(db_file):
+    # Picks up anything still appended to the legacy CSV logs; a no-op once they are imported
+    conn = store.connect(db_file)
+    for log_file in (config["log_file"], config["temp_log_file"]):
+        store.import_csv_log(conn, log_file)
+    return conn
+
+def load_rollups(db_file, by, start=None, end=None, channels=(), file_types=()):
+    """
+    Upload counts and byte totals from the daily channel x file-type rollups.
+
+    Returns:
+        A DataFrame with one column per `by` entry (Date, Channel, FileType) plus Uploads and Bytes.
+    """
+    conn = open_log_store(db_file)
+    try:
+        rows = store.query_rollups(conn, by, start, end, channels, file_types)
+    finally:
+        conn.close()
+    df = pd.DataFrame(rows, columns=[ROLLUP_NAMES[column] for column in by] + ["Uploads", "Bytes"])
+    if "Date" in df.columns:
+        df["Date"] = pd.to_datetime(df["Date"]).dt.date
+    return df
+
+LOG_COLUMNS = ["Timestamp", "File", "Channel", "FileType", "Size", "Date"]
+
+# Shared by every Streamlit rerun in this process; only rows added since last_id are read
+_log_cache = {"db_file": None, "last_id": 0, "df": pd.DataFrame(columns=LOG_COLUMNS)}
+_log_lock = threading.Lock()
+
+def load_logs(db_file):
+    """
+    Returns the upload log as a DataFrame (typed Timestamp, plus Size and Date) and the channel count.
+
+    The frame is cached for the whole process and extended incrementally, so callers must not modify it.
+    """
+    with _log_lock:
+        if _log_cache["db_file"] != db_file:
+            _log_cache.update(db_file=db_file, last_id=0, df=pd.DataFrame(columns=LOG_COLUMNS))
+        conn = open_log_store(db_file)
         try:
-            df_log = pd.read_csv(log_file, names=["Timestamp", "File", "Channel", "FileType"])
-            channels = df_log["Channel"].nunique()
-            return df_log, channels
-        except:
-            return pd.DataFrame(), 0
-    else:
-        return pd.DataFrame(), 0
+            ids, ts_us, files, channels, file_types, sizes = store.read_log(conn, _log_cache["last_id"])
+        finally:
+            conn.close()
+
+        if ids:
+            timestamps = pd.to_datetime(pd.Series(ts_us, dtype="int64"), unit="us")
+            new_rows = pd.DataFrame({
+                "Timestamp": timestamps,
+                "File": files,
+                "Channel": channels,
+                "FileType": file_types,
+                "Size": sizes,
+                "Date": timestamps.dt.date,
+            })
+            df = new_rows if _log_cache["df"].empty else pd.concat([_log_cache["df"], new_rows], ignore_index=True)
+            _log_cache.update(last_id=ids[-1], df=df)
+        df_log = _log_cache["df"]
+
+    return df_log, df_log["Channel"].nunique() if not df_log.empty else 0
     
-def filter_files(files, folder, filter_method, filter_params):
-    if filter_method == "None":
-        return files
-
-    filtered = []
-
-    if filter_method == "Name":
-        name_filter = filter_params.get('name_filter', '').lower()
-        if not name_filter:
-            return files  # No filter text, return all
-        # return filter_files_by_name_range(files, name_filter)
-        filtered = [f for f in files if name_filter in f.lower()]
-
-    elif filter_method == "Date":
-        start_date = filter_params.get('start_date')
-        end_date = filter_params.get('end_date')
-        if not start_date or not end_date:
-            return files  # Dates not properly set
-        for f in files:
-            file_path = os.path.join(folder, f)
-            mod_time = os.path.getmtime(file_path)
-            mod_date = datetime.fromtimestamp(mod_time).date()
-            if start_date <= mod_date <= end_date:
-                filtered.append(f)
-
-    elif filter_method == "Size":
-        min_size = filter_params.get('min_size', 0)
-        max_size = filter_params.get('max_size', 0)
-        for f in files:
-            file_path = os.path.join(folder, f)
-            size_kb = os.path.getsize(file_path) / 1024
-            if size_kb >= min_size and (max_size == 0 or size_kb <= max_size):
-                filtered.append(f)
-
-    else:
-        return files
-
-    return filtered
-
-def convert_to_jpg(path):
+# === SUPPORTED TYPES ===
+MEDIA_GROUP_TYPES = ('.jpg', '.jpeg', '.png', '.mp4', '.mov', '.mkv', '.pdf', '.docx', '.heic', '.webp')
+OTHER_TYPES = ('.zip', '.rar', '.7z', '.txt', '.xls', '.ppt', '.exe')
+SUPPORTED_EXTENSIONS = MEDIA_GROUP_TYPES + OTHER_TYPES
+
+FILE_COLUMNS = ["name", "ext", "size", "mtime"]
+
+
+def scan_folder(folder):
+    """
+    One os.scandir pass over folder.
+
+    Returns:
+        DataFrame of the regular files in folder: name, lowercased ext, size (bytes), mtime (epoch seconds)
+    """
+    rows = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            try:
+                if entry.is_file():
+                    st = entry.stat()
+                    rows.append((entry.name, os.path.splitext(entry.name)[1].lower(), st.st_size, st.st_mtime))
+            except OSError:
+                pass
+    return pd.DataFrame(rows, columns=FILE_COLUMNS).astype({"size": "int64", "mtime": "float64"})
+
+
+class FileFilter:
+    """
+    A condition on scan_folder tables, evaluated for all rows at once.
+    Combine with & (and), | (or) and ~ (not).
+    """
+
+    def __init__(self, mask):
+        self.mask = mask    # table -> boolean Series
+
+    def __and__(self, other):
+        return FileFilter(lambda t: self.mask(t) & other.mask(t))
+
+    def __or__(self, other):
+        return FileFilter(lambda t: self.mask(t) | other.mask(t))
+
+    def __invert__(self):
+        return FileFilter(lambda t: ~self.mask(t))
+
+    def apply(self, table):
+        return table[self.mask(table)]
+
+
+ALL_FILES = FileFilter(lambda t: pd.Series(True, index=t.index))
+
+
+def name_range(start, end):
+    """
+    Names starting with a letter from start to end, e.g. name_range("A", "H").
+    """
+    return FileFilter(lambda t: t["name"].str[:1].str.upper().between(start.upper(), end.upper()))
+
+
+def name_contains(text):
+    return FileFilter(lambda t: t["name"].str.lower().str.contains(text.lower(), regex=False))
+
+
+def name_matches(pattern):
+    return FileFilter(lambda t: t["name"].str.contains(pattern, case=False, regex=True))
+
+
+def name_filter(text):
+    """
+    "A-H" is a first-letter range, anything else a case-insensitive substring.
+    """
+    text = text.strip()
+    if len(text) == 3 and text[1] == '-' and text[0].isalpha() and text[2].isalpha() and text[0].upper() <= text[2].upper():
+        return name_range(text[0], text[2])
+    return name_contains(text)
+
+
+def date_window(start_date=None, end_date=None):
+    """
+    Modified on or after start_date and on or before end_date (local dates, either may be None).
+    """
+    low = datetime.combine(start_date, datetime.min.time()).timestamp() if start_date else float("-inf")
+    high = datetime.combine(end_date + timedelta(days=1), datetime.min.time()).timestamp() if end_date else float("inf")
+    return FileFilter(lambda t: (t["mtime"] >= low) & (t["mtime"] < high))
+
+
+def size_window(min_kb=0, max_kb=0):
+    """
+    Size between min_kb and max_kb KB; max_kb 0 means no upper bound.
+    """
+    return FileFilter(lambda t: (t["size"] >= min_kb * 1024) & ((t["size"] <= max_kb * 1024) if max_kb else True))
+
+
+def type_set(extensions):
+    extensions = {e.lower() if e.startswith(".") else "." + e.lower() for e in extensions}
+    return FileFilter(lambda t: t["ext"].isin(extensions))
+
+
+def build_filter(filter_method, filter_params):
+    """
+    FileFilter from the Uploads page: filter_method is one criterion name or a list
+    of them ("Name", "Regex", "Date", "Size", "Type"), all of which must match.
+    Criteria left empty in filter_params are ignored.
+    """
+    methods = [filter_method] if isinstance(filter_method, str) else list(filter_method or [])
+    params = filter_params or {}
+    expression = ALL_FILES
+    for method in methods:
+        if method == "Name" and params.get("name_filter"):
+            expression &= name_filter(params["name_filter"])
+        elif method == "Regex" and params.get("name_regex"):
+            expression &= name_matches(params["name_regex"])
+        elif method == "Date" and params.get("start_date") and params.get("end_date"):
+            expression &= date_window(params["start_date"], params["end_date"])
+        elif method == "Size":
+            expression &= size_window(params.get("min_size", 0), params.get("max_size", 0))
+        elif method == "Type" and params.get("file_types"):
+            expression &= type_set(params["file_types"])
+    return expression
+
+
+def filter_files(table, filter_method, filter_params):
+    """
+    Names of the files in a scan_folder table that pass the page's filters.
+    """
+    return build_filter(filter_method, filter_params).apply(table)["name"].tolist()
+
+CONVERT_TYPES = (".webp", ".heic")
+
+_convert_pool = None
+_converting = {}
+_pinned = Counter()     # converted path -> convert_stream hand-outs not released yet
+
+def converted_path(path):
+    """
+    Cache location of the JPG for path; a changed size or mtime gives a new entry.
+    """
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return os.path.join(config["convert_cache_dir"], hashlib.sha1(key.encode()).hexdigest() + ".jpg")
+
+def _convert_file(path, target):
+    # Runs in the process pool; written under a temporary name so a half-written JPG is never cached
+    with Image.open(path) as im:
+        rgb_im = im.convert("RGB")
+        partial = target + ".part"
+        rgb_im.save(partial, format="JPEG")
+    os.replace(partial, target)
+    return target
+
+def convert_pool():
+    """
+    The shared process pool for conversions and other per-file CPU work.
+    """
+    global _convert_pool
+    if _convert_pool is None:
+        _convert_pool = ProcessPoolExecutor(config["convert_workers"])
+    return _convert_pool
+
+def submit_conversion(path):
+    """
+    Starts converting path in the shared process pool.
+
+    Returns:
+        A concurrent.futures.Future of the path to upload (path itself if no conversion is needed).
+    """
+    future = Future()
+    if os.path.splitext(path)[1].lower() not in CONVERT_TYPES:
+        future.set_result(path)
+        return future
+    target = converted_path(path)
+    if os.path.exists(target):
+        os.utime(target)  # Mark as recently used for prune_convert_cache
+        future.set_result(target)
+        return future
+    if target in _converting:
+        return _converting[target]
+    future = convert_pool().submit(_convert_file, path, target)
+    _converting[target] = future
+    future.add_done_callback(lambda f: _converting.pop(target, None))
+    return future
+
+def prune_convert_cache(max_bytes):
+    """
+    Deletes the least recently used converted files until the cache fits in max_bytes.
+    Files being converted or handed out by convert_stream and not released are kept.
+    """
+    entries = []
+    with os.scandir(config["convert_cache_dir"]) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if _pinned[path] or path in _converting:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def _pin(path):
+    # Returns the converted path now pinned for path, or None if path is not converted
+    if os.path.splitext(path)[1].lower() not in CONVERT_TYPES:
+        return None
     try:
-        ext = os.path.splitext(path)[1].lower()
-        if ext == ".webp" or ext == ".heic":
-            heif_file = None
-            with Image.open(path) as im:
-                rgb_im = im.convert("RGB")
-                fd, new_path = tempfile.mkstemp(suffix=".jpg")
-                os.close(fd)  # Close the file descriptor
-                rgb_im.save(new_path, format="JPEG")
-                return new_path
-    except Exception as e:
-        print(f"Error converting {path} to JPG: {e}")
-    return path
-
-def filter_files_by_name_range(files, name_filter):
-    """
-    Filters files whose names start with any letter in the range specified.
-    Example input: "A-H" filters files starting with letters A, B, C, ..., H.
-    """
-    name_filter = name_filter.strip()
-    filtered = []
-
-    # Detect if input is in form X-Y (e.g. A-H)
-    if len(name_filter) == 3 and name_filter[1] == '-':
-        start_letter = name_filter[0].upper()
-        end_letter = name_filter[2].upper()
-        if start_letter.isalpha() and end_letter.isalpha() and start_letter <= end_letter:
-            valid_letters = [chr(c) for c in range(ord(start_letter), ord(end_letter) + 1)]
-            for f in files:
-                first_char = f[0].upper() if f else ''
-                if first_char in valid_letters:
-                    filtered.append(f)
-            return filtered
-
-    # Otherwise treat as substring filter (case-insensitive)
-    return [f for f in files if name_filter.lower() in f.lower()]
+        target = converted_path(path)
+    except OSError:
+        return None
+    _pinned[target] += 1
+    return target
+
+def release_conversion(upload_path):
+    """
+    Releases a path handed out by convert_stream once it has been sent (or given up on),
+    and prunes the cache back to CONVERT_CACHE_MB now that it may be removed.
+    """
+    if not _pinned[upload_path]:
+        _pinned.pop(upload_path, None)
+        return
+    _pinned[upload_path] -= 1
+    if not _pinned[upload_path]:
+        del _pinned[upload_path]
+    prune_convert_cache(config["convert_cache_mb"] * 1024 * 1024)
+
+async def convert_stream(paths, lookahead=None):
+    """
+    Yields (source, upload_path) in input order while the next files convert in parallel,
+    so the first upload starts as soon as the first file is ready.
+
+    At most `lookahead` conversions run ahead of the consumer. Converted files are pinned
+    from submission until the consumer passes them to release_conversion, so pruning
+    never removes a file about to be sent; each release prunes the cache back to
+    CONVERT_CACHE_MB. Scratch use is the cap plus the pinned files (the lookahead and
+    whatever the consumer has not released). Close the generator (contextlib.aclosing)
+    so conversions that were never handed out are unpinned.
+    """
+    lookahead = lookahead or config["convert_workers"] * 2
+    prune_convert_cache(config["convert_cache_mb"] * 1024 * 1024)
+    pending = deque()
+    sources = iter(paths)
+
+    def submit(path):
+        target = _pin(path)
+        pending.append((path, target, submit_conversion(path)))
+
+    try:
+        for path in sources:
+            submit(path)
+            if len(pending) >= lookahead:
+                break
+        while pending:
+            path, target, future = pending.popleft()
+            try:
+                upload_path = await asyncio.wrap_future(future)
+            except Exception as e:
+                print(f"Error converting {path} to JPG: {e}")
+                upload_path = path
+            if target and upload_path != target:
+                release_conversion(target)
+            next_path = next(sources, None)
+            if next_path is not None:
+                submit(next_path)
+            yield path, upload_path
+    finally:
+        for _, target, _ in pending:
+            if target:
+                release_conversion(target)
+
+# Telegram albums may mix photos and videos, but documents can only be grouped with documents
+ALBUM_VISUAL_TYPES = ('.jpg', '.jpeg', '.png', '.mp4', '.mov', '.mkv', '.heic', '.webp')
+
+def pack_media_groups(files, max_items=10, max_bytes=0):
+    """
+    Packs (name, size) pairs into album-compatible groups.
+
+    Photos/videos and documents go in separate groups. Each kind starts with the fewest
+    groups that max_items and max_bytes allow, and the largest files are spread first so
+    every group carries about the same number of bytes. A file that fits no group opens a
+    new one; a file larger than max_bytes on its own gets a group to itself.
+
+    >>> pack_media_groups([("a.mp4", 6), ("b.mp4", 6), ("c.mp4", 6)], max_bytes=10)
+    [['a.mp4'], ['b.mp4'], ['c.mp4']]
+
+    Returns:
+        A list of groups (lists of names), each in the original file order.
+    """
+    order = {name: i for i, (name, _) in enumerate(files)}
+    visual = [(name, size) for name, size in files if os.path.splitext(name)[1].lower() in ALBUM_VISUAL_TYPES]
+    documents = [(name, size) for name, size in files if os.path.splitext(name)[1].lower() not in ALBUM_VISUAL_TYPES]
+
+    groups = []
+    for kind in (visual, documents):
+        if not kind:
+            continue
+        count = -(-len(kind) // max_items)
+        if max_bytes:
+            total = sum(size for _, size in kind if size <= max_bytes)
+            count = max(count, -(-total // max_bytes))
+        bins = [[0, []] for _ in range(min(count, len(kind)))]
+        for name, size in sorted(kind, key=lambda item: item[1], reverse=True):
+            # Largest remaining file goes to the lightest group it still fits in
+            fits = [b for b in bins if len(b[1]) < max_items and (not max_bytes or b[0] + size <= max_bytes)]
+            if fits:
+                target = min(fits, key=lambda b: b[0])
+            else:
+                target = [0, []]
+                bins.append(target)
+            target[0] += size
+            target[1].append(name)
+        # Zero-byte files weigh nothing, so a byte-based count can leave a group empty
+        groups.extend(sorted(names, key=order.get) for _, names in bins if names)
+    return sorted(groups, key=lambda names: order[names[0]])
+
+def content_hash(path, chunk_size=1024 * 1024):
+    """
+    SHA-256 of the file contents, read in chunks so large videos never sit in memory.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 # # === SUPPORTED TYPES ===
 # MEDIA_GROUP_TYPES = ('.jpg', '.jpeg', '.png', '.mp4', '.mov', '.mkv', '.pdf', '.docx', '.heic', '.webp')
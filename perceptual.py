@@ -0,0 +1,168 @@
+# perceptual.py
+#
+# Perceptual hashes that survive resizing and re-encoding: a 64-bit DCT hash (pHash) for
+# images and one pHash per sampled frame for videos. Each channel keeps an index of what
+# was already posted there, and lookups compare against all of it at once with NumPy.
+
+import os
+import asyncio
+import threading
+import numpy as np
+import cv2
+from PIL import Image
+from model import config, convert_pool
+import store
+
+IMAGE_TYPES = ('.jpg', '.jpeg', '.png', '.heic', '.webp')
+VIDEO_TYPES = ('.mp4', '.mov', '.mkv')
+VIDEO_SAMPLES = (0.1, 0.3, 0.5, 0.7, 0.9)   # positions in the video, as a fraction of its length
+
+_SIZE = 32
+_DCT = np.array([
+    [np.cos(np.pi * (2 * n + 1) * k / (2 * _SIZE)) for n in range(_SIZE)]
+    for k in range(_SIZE)
+])
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _phash(gray):
+    # gray: 2-D uint8 array of any size
+    pixels = cv2.resize(gray, (_SIZE, _SIZE), interpolation=cv2.INTER_AREA).astype(np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return np.uint64(int.from_bytes(np.packbits(bits).tobytes(), "big"))
+
+
+def image_hash(path):
+    with Image.open(path) as im:
+        gray = np.asarray(im.convert("L"))
+    return np.array([_phash(gray)], dtype=np.uint64)
+
+
+def video_hash(path):
+    capture = cv2.VideoCapture(path)
+    try:
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count <= 0:
+            return None
+        hashes = []
+        for position in VIDEO_SAMPLES:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, int(frame_count * position))
+            ok, frame = capture.read()
+            if not ok:
+                return None
+            hashes.append(_phash(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)))
+        return np.array(hashes, dtype=np.uint64)
+    finally:
+        capture.release()
+
+
+def perceptual_hash(path):
+    """
+    Returns (kind, hash row) for an image or video, or (None, None) if it cannot be hashed.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext in IMAGE_TYPES:
+            return "image", image_hash(path)
+        if ext in VIDEO_TYPES:
+            row = video_hash(path)
+            return ("video", row) if row is not None else (None, None)
+    except Exception as e:
+        print(f"Could not hash {path}: {e}")
+    return None, None
+
+
+_pool_limit = None
+_pool_limit_loop = None
+
+
+def _limit():
+    # One limit for the whole process, like the pool it guards; a new event loop gets a new one
+    global _pool_limit, _pool_limit_loop
+    loop = asyncio.get_running_loop()
+    if loop is not _pool_limit_loop:
+        _pool_limit = asyncio.Semaphore(config["convert_workers"])
+        _pool_limit_loop = loop
+    return _pool_limit
+
+
+def start_hashes(conn, files):
+    """
+    Starts perceptual hashes for {name: (content hash, path)} in the shared conversion
+    process pool. All rows share one limit of CONVERT_WORKERS hashes in the pool at a
+    time, so conversions are not queued behind them. Content hashed before comes from
+    the store; new results are saved there.
+
+    Returns:
+        {name: task resolving to (kind, hash row), or (None, None)}
+    """
+    limit = _limit()
+
+    async def run(content_hash, path):
+        cached = store.get_content_phash(conn, content_hash)
+        if cached:
+            kind, blob = cached
+            return (kind, np.frombuffer(blob, dtype=np.uint64)) if kind else (None, None)
+        async with limit:
+            kind, row = await asyncio.wrap_future(convert_pool().submit(perceptual_hash, path))
+        store.save_content_phash(conn, content_hash, kind or "", row.tobytes() if kind else b"")
+        return kind, row
+
+    return {name: asyncio.ensure_future(run(*item)) for name, item in files.items()}
+
+
+class PerceptualIndex:
+    """
+    Packed hash rows (one uint64 per image, one per sampled frame for videos)
+    with vectorised Hamming-distance lookups.
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self._hashes = np.empty((64, width), dtype=np.uint64)
+        self._files = []
+
+    def __len__(self):
+        return len(self._files)
+
+    def add(self, row, file):
+        if len(self._files) == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.empty_like(self._hashes)])
+        self._hashes[len(self._files)] = row
+        self._files.append(file)
+
+    def nearest(self, row):
+        """
+        Returns (distance, file) of the closest entry; for videos the distance is
+        averaged over the sampled frames. None if the index is empty.
+        """
+        if not self._files:
+            return None
+        xored = self._hashes[:len(self._files)] ^ np.asarray(row, dtype=np.uint64)
+        distances = _POPCOUNT[xored.view(np.uint8)].reshape(len(self._files), -1).sum(axis=1) / self.width
+        best = int(np.argmin(distances))
+        return float(distances[best]), self._files[best]
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def channel_index(conn, channel, kind):
+    """
+    Process-wide index of what was posted to channel, loaded from the store on first use.
+    """
+    with _lock:
+        key = (channel, kind)
+        if key not in _indexes:
+            index = PerceptualIndex(1 if kind == "image" else len(VIDEO_SAMPLES))
+            for blob, file in store.perceptual_hashes(conn, channel, kind):
+                index.add(np.frombuffer(blob, dtype=np.uint64), file)
+            _indexes[key] = index
+        return _indexes[key]
+
+
+def remember(conn, channel, kind, row, file):
+    store.save_perceptual_hash(conn, channel, kind, np.asarray(row, dtype=np.uint64).tobytes(), file)
+    channel_index(conn, channel, kind).add(row, file)
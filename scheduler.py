@@ -0,0 +1,53 @@
+# scheduler.py
+
+import asyncio
+import time
+from telethon.errors import FloodWaitError
+
+
+class UploadScheduler:
+    """
+    Runs Telegram send calls for many channels at once on one shared client.
+
+    Every call takes a slot from the global limit and from its channel's lane.
+    A FloodWait only pauses the lane of the channel that raised it; the global
+    slot is released while the lane sleeps so other channels keep uploading.
+    """
+
+    def __init__(self, max_concurrent=4, per_channel=1, on_flood_wait=None):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.per_channel = max(1, int(per_channel))
+        self.on_flood_wait = on_flood_wait
+        self._global = asyncio.Semaphore(self.max_concurrent)
+        self._lanes = {}
+        self._paused_until = {}
+
+    def _lane(self, channel):
+        if channel not in self._lanes:
+            self._lanes[channel] = asyncio.Semaphore(self.per_channel)
+        return self._lanes[channel]
+
+    async def _wait_for_lane(self, channel):
+        delay = self._paused_until.get(channel, 0) - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._paused_until.get(channel, 0) - time.monotonic()
+
+    def pause(self, channel, seconds):
+        until = time.monotonic() + seconds
+        self._paused_until[channel] = max(self._paused_until.get(channel, 0), until)
+
+    async def run(self, channel, func, *args, **kwargs):
+        """
+        Awaits func(*args, **kwargs) inside the channel lane, retrying on FloodWait.
+        """
+        async with self._lane(channel):
+            while True:
+                await self._wait_for_lane(channel)
+                async with self._global:
+                    try:
+                        return await func(*args, **kwargs)
+                    except FloodWaitError as e:
+                        self.pause(channel, e.seconds)
+                        if self.on_flood_wait:
+                            self.on_flood_wait(channel, e.seconds)
@@ -0,0 +1,625 @@
+# store.py
+
+import os
+import csv
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    folder      TEXT NOT NULL,
+    filename    TEXT NOT NULL,
+    channel     TEXT NOT NULL DEFAULT '',
+    uploaded_at TEXT NOT NULL,
+    PRIMARY KEY (folder, filename, channel)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS skipped_uploads (
+    folder     TEXT NOT NULL,
+    filename   TEXT NOT NULL,
+    channel    TEXT NOT NULL,
+    reason     TEXT NOT NULL,
+    skipped_at TEXT NOT NULL,
+    PRIMARY KEY (folder, filename, channel)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sent_hashes (
+    content_hash TEXT NOT NULL,
+    channel      TEXT NOT NULL,
+    PRIMARY KEY (content_hash, channel)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS media_refs (
+    content_hash   TEXT PRIMARY KEY,
+    kind           TEXT NOT NULL,
+    media_id       INTEGER NOT NULL,
+    access_hash    INTEGER NOT NULL,
+    file_reference BLOB NOT NULL,
+    updated_at     TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS upload_progress (
+    source      TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    file_id     INTEGER NOT NULL,
+    part_size   INTEGER NOT NULL,
+    part_count  INTEGER NOT NULL,
+    parts       BLOB NOT NULL,
+    updated_at  TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind        TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'queued',
+    created_at  TEXT NOT NULL,
+    started_at  TEXT,
+    finished_at TEXT,
+    files_done  INTEGER NOT NULL DEFAULT 0,
+    files_total INTEGER NOT NULL DEFAULT 0,
+    bytes_done  INTEGER NOT NULL DEFAULT 0,
+    logs        TEXT NOT NULL DEFAULT '[]'
+);
+
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+
+CREATE TABLE IF NOT EXISTS downloads (
+    channel       TEXT NOT NULL,
+    media_id      INTEGER NOT NULL,
+    message_id    INTEGER NOT NULL,
+    filename      TEXT NOT NULL,
+    downloaded_at TEXT NOT NULL,
+    PRIMARY KEY (channel, media_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    channel TEXT PRIMARY KEY,
+    max_id  INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS upload_log (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts_us     INTEGER NOT NULL,
+    file      TEXT NOT NULL,
+    channel   TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    size      INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (ts_us, file, channel)
+);
+
+CREATE TABLE IF NOT EXISTS upload_rollup (
+    day       TEXT NOT NULL,
+    channel   TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    uploads   INTEGER NOT NULL,
+    bytes     INTEGER NOT NULL,
+    PRIMARY KEY (day, channel, file_type)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS upload_log_rollup AFTER INSERT ON upload_log
+BEGIN
+    INSERT INTO upload_rollup VALUES (date(NEW.ts_us / 1000000, 'unixepoch'), NEW.channel, NEW.file_type, 1, NEW.size)
+    ON CONFLICT (day, channel, file_type) DO UPDATE SET uploads = uploads + 1, bytes = bytes + excluded.bytes;
+END;
+
+CREATE TABLE IF NOT EXISTS file_hashes (
+    dev      INTEGER NOT NULL,
+    ino      INTEGER NOT NULL,
+    kind     TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    value    TEXT NOT NULL,
+    PRIMARY KEY (dev, ino, kind)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS entities (
+    key         TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    peer_id     INTEGER NOT NULL,
+    access_hash INTEGER,
+    resolved_at TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS perceptual_hashes (
+    channel TEXT NOT NULL,
+    kind    TEXT NOT NULL,
+    hash    BLOB NOT NULL,
+    file    TEXT NOT NULL,
+    PRIMARY KEY (channel, kind, hash)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS content_phashes (
+    content_hash TEXT PRIMARY KEY,
+    kind         TEXT NOT NULL,     -- '' when the file could not be hashed
+    hash         BLOB NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO meta (key, value) VALUES ('upload_count', 0);
+
+CREATE TRIGGER IF NOT EXISTS uploads_count AFTER INSERT ON uploads
+BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'upload_count';
+END;
+"""
+
+
+def connect(db_file):
+    """
+    Opens the upload store, creating the tables on first use.
+    """
+    os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    if not conn.execute("SELECT 1 FROM meta WHERE key = 'rollup_built'").fetchone():
+        rebuild_rollups(conn)
+    return conn
+
+
+def _split_key(line):
+    # Old cache lines are os.path.join(folder, filename), written on Windows or Linux
+    cut = max(line.rfind("/"), line.rfind("\\"))
+    return line[:cut], line[cut + 1:]
+
+
+def import_text_cache(conn, cache_file):
+    """
+    Imports lines appended to an uploaded_cache.txt since the last import.
+
+    The old cache had no channel, so imported entries count for every channel.
+
+    Returns:
+        The number of new entries.
+    """
+    if not os.path.exists(cache_file):
+        return 0
+    key = "imported:" + os.path.abspath(cache_file)
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    offset = row[0] if row else 0
+    if offset > os.path.getsize(cache_file):
+        offset = 0  # File was replaced or truncated
+
+    now = datetime.now().isoformat()
+    before = upload_count(conn)
+    with open(cache_file, "rb") as f:
+        f.seek(offset)
+        rows = []
+        for raw in f:
+            line = raw.decode("utf-8", errors="replace").strip()
+            if line:
+                folder, filename = _split_key(line)
+                rows.append((folder, filename, "", now))
+        offset = f.tell()
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO uploads VALUES (?, ?, ?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, offset))
+    return upload_count(conn) - before
+
+
+def uploaded_names(conn, folder, channel):
+    """
+    Returns the set of filenames in folder already sent to channel.
+    """
+    cur = conn.execute(
+        "SELECT filename FROM uploads WHERE folder = ? AND channel IN (?, '')",
+        (folder, channel),
+    )
+    return {row[0] for row in cur}
+
+
+def handled_names(conn, folder, channel):
+    """
+    Returns the set of filenames in folder already sent to channel or skipped for it.
+    """
+    cur = conn.execute(
+        "SELECT filename FROM uploads WHERE folder = ? AND channel IN (?, '') "
+        "UNION SELECT filename FROM skipped_uploads WHERE folder = ? AND channel = ?",
+        (folder, channel, folder, channel),
+    )
+    return {row[0] for row in cur}
+
+
+def record_skips(conn, folder, filenames, channel, reason):
+    """
+    Marks files as not to be sent to channel (their content is there already). Kept apart
+    from uploads so the upload counters only count files that were actually sent.
+    """
+    now = datetime.now().isoformat()
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO skipped_uploads VALUES (?, ?, ?, ?, ?)",
+            [(folder, name, channel, reason, now) for name in filenames],
+        )
+
+
+def record_uploads(conn, folder, filenames, channel, hashes=()):
+    """
+    Marks a batch of files (and their content hashes) as uploaded in a single transaction.
+    """
+    now = datetime.now().isoformat()
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO uploads VALUES (?, ?, ?, ?)",
+            [(folder, name, channel, now) for name in filenames],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO sent_hashes VALUES (?, ?)",
+            [(h, channel) for h in hashes],
+        )
+
+
+def sent_hashes(conn, hashes, channel):
+    """
+    Returns the subset of hashes whose content was already sent to channel.
+    """
+    found = set()
+    for h in set(hashes):
+        cur = conn.execute(
+            "SELECT 1 FROM sent_hashes WHERE content_hash = ? AND channel = ?", (h, channel)
+        )
+        if cur.fetchone():
+            found.add(h)
+    return found
+
+
+def get_media_ref(conn, content_hash):
+    """
+    Returns (kind, media_id, access_hash, file_reference) of media Telegram already holds, or None.
+    """
+    return conn.execute(
+        "SELECT kind, media_id, access_hash, file_reference FROM media_refs WHERE content_hash = ?",
+        (content_hash,),
+    ).fetchone()
+
+
+def save_media_ref(conn, content_hash, kind, media_id, access_hash, file_reference):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO media_refs VALUES (?, ?, ?, ?, ?, ?)",
+            (content_hash, kind, media_id, access_hash, file_reference, datetime.now().isoformat()),
+        )
+
+
+def drop_media_ref(conn, content_hash):
+    with conn:
+        conn.execute("DELETE FROM media_refs WHERE content_hash = ?", (content_hash,))
+
+
+def get_upload_progress(conn, source):
+    """
+    Returns (fingerprint, file_id, part_size, part_count, parts, updated_at) of an
+    unfinished upload, or None. parts holds one byte per part, 1 once acknowledged.
+    """
+    return conn.execute(
+        "SELECT fingerprint, file_id, part_size, part_count, parts, updated_at FROM upload_progress WHERE source = ?",
+        (source,),
+    ).fetchone()
+
+
+def save_upload_progress(conn, source, fingerprint, file_id, part_size, part_count, parts):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO upload_progress VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (source, fingerprint, file_id, part_size, part_count, bytes(parts), datetime.now().isoformat()),
+        )
+
+
+def clear_upload_progress(conn, source):
+    with conn:
+        conn.execute("DELETE FROM upload_progress WHERE source = ?", (source,))
+
+
+def enqueue_job(conn, kind, payload):
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO jobs (kind, payload, created_at) VALUES (?, ?, ?)",
+            (kind, json.dumps(payload), datetime.now().isoformat()),
+        )
+    return cur.lastrowid
+
+
+def claim_next_job(conn, busy_kinds=()):
+    """
+    Marks the oldest queued job whose kind is not busy as running.
+
+    Returns:
+        (id, kind, payload) or None when nothing can run.
+    """
+    busy_kinds = tuple(busy_kinds)
+    query = "SELECT id, kind, payload FROM jobs WHERE status = 'queued'"
+    if busy_kinds:
+        query += f" AND kind NOT IN ({','.join('?' * len(busy_kinds))})"
+    with conn:
+        row = conn.execute(query + " ORDER BY id LIMIT 1", busy_kinds).fetchone()
+        if not row:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+            (datetime.now().isoformat(), row[0]),
+        )
+    return row[0], row[1], json.loads(row[2])
+
+
+def requeue_running_jobs(conn):
+    """
+    Puts jobs left running by a worker that died back in the queue.
+    """
+    with conn:
+        # They start over, so their progress does too
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'queued', files_done = 0, files_total = 0, bytes_done = 0 WHERE status = 'running'"
+        )
+    return cur.rowcount
+
+
+def add_job_progress(conn, job_id, files=0, nbytes=0, total=0):
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET files_done = files_done + ?, bytes_done = bytes_done + ?, files_total = files_total + ? WHERE id = ?",
+            (files, nbytes, total, job_id),
+        )
+
+
+def finish_job(conn, job_id, status, logs):
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, logs = ? WHERE id = ?",
+            (status, datetime.now().isoformat(), json.dumps(logs), job_id),
+        )
+
+
+def list_jobs(conn, kind=None, limit=10):
+    """
+    Returns the newest jobs as dicts, optionally only one kind.
+    """
+    query = "SELECT * FROM jobs"
+    params = ()
+    if kind:
+        query += " WHERE kind = ?"
+        params = (kind,)
+    cur = conn.execute(query + " ORDER BY id DESC LIMIT ?", params + (limit,))
+    columns = [c[0] for c in cur.description]
+    jobs = []
+    for row in cur:
+        job = dict(zip(columns, row))
+        job["payload"] = json.loads(job["payload"])
+        job["logs"] = json.loads(job["logs"])
+        jobs.append(job)
+    return jobs
+
+
+def downloaded_media_ids(conn, channel):
+    return {row[0] for row in conn.execute("SELECT media_id FROM downloads WHERE channel = ?", (channel,))}
+
+
+def record_download(conn, channel, media_id, message_id, filename):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?)",
+            (channel, media_id, message_id, filename, datetime.now().isoformat()),
+        )
+
+
+def get_synced_id(conn, channel):
+    """
+    Highest message id of channel whose media is all downloaded (0 if never synced).
+    """
+    row = conn.execute("SELECT max_id FROM sync_state WHERE channel = ?", (channel,)).fetchone()
+    return row[0] if row else 0
+
+
+def set_synced_id(conn, channel, max_id):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (channel, max_id))
+
+
+def to_us(ts):
+    """
+    Local wall-clock datetime as integer microseconds, read back with pd.to_datetime(unit="us").
+    """
+    return (ts - EPOCH) // timedelta(microseconds=1)
+
+
+def record_log(conn, rows):
+    """
+    Appends (timestamp, file, channel, file_type, size) rows to the upload log in one transaction.
+    """
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO upload_log (ts_us, file, channel, file_type, size) VALUES (?, ?, ?, ?, ?)",
+            [(to_us(ts), file, channel, file_type, size) for ts, file, channel, file_type, size in rows],
+        )
+
+
+def import_csv_log(conn, log_file):
+    """
+    Imports rows appended to an upload_log.csv since the last import.
+
+    Lines repeated by the old temp-log merge have the same timestamp, file and
+    channel, so they are stored once.
+
+    Returns:
+        The number of lines read.
+    """
+    if not os.path.exists(log_file):
+        return 0
+    key = "imported:" + os.path.abspath(log_file)
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    offset = row[0] if row else 0
+    if offset > os.path.getsize(log_file):
+        offset = 0
+
+    rows = []
+    with open(log_file, "rb") as f:
+        f.seek(offset)
+        lines = (raw.decode("utf-8", errors="replace") for raw in f)
+        for fields in csv.reader(lines):
+            if len(fields) < 4:
+                continue
+            try:
+                ts = datetime.fromisoformat(fields[0].strip())
+            except ValueError:
+                continue
+            rows.append((ts, fields[1], fields[2], fields[3], 0))
+        offset = f.tell()
+    record_log(conn, rows)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, offset))
+    return len(rows)
+
+
+def read_log(conn, after_id=0):
+    """
+    Returns (ids, ts_us, files, channels, file_types, sizes) columns for log rows after after_id.
+    """
+    rows = conn.execute(
+        "SELECT id, ts_us, file, channel, file_type, size FROM upload_log WHERE id > ? ORDER BY id",
+        (after_id,),
+    ).fetchall()
+    if not rows:
+        return [], [], [], [], [], []
+    return [list(column) for column in zip(*rows)]
+
+
+def get_file_hash(conn, dev, ino, size, mtime_ns, kind):
+    """
+    Cached hash of a file, or None if it was never hashed or has changed since.
+    """
+    row = conn.execute(
+        "SELECT value FROM file_hashes WHERE dev = ? AND ino = ? AND kind = ? AND size = ? AND mtime_ns = ?",
+        (dev, ino, kind, size, mtime_ns),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def save_file_hash(conn, dev, ino, size, mtime_ns, kind, value):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?)",
+            (dev, ino, kind, size, mtime_ns, value),
+        )
+
+
+def get_entity(conn, key, max_age):
+    """
+    Returns (kind, peer_id, access_hash) resolved less than max_age (a timedelta) ago, or None.
+    """
+    return conn.execute(
+        "SELECT kind, peer_id, access_hash FROM entities WHERE key = ? AND resolved_at >= ?",
+        (key, (datetime.now() - max_age).isoformat()),
+    ).fetchone()
+
+
+def save_entity(conn, key, kind, peer_id, access_hash):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?)",
+            (key, kind, peer_id, access_hash, datetime.now().isoformat()),
+        )
+
+
+def drop_entity(conn, key):
+    with conn:
+        conn.execute("DELETE FROM entities WHERE key = ?", (key,))
+
+
+def perceptual_hashes(conn, channel, kind):
+    return conn.execute(
+        "SELECT hash, file FROM perceptual_hashes WHERE channel = ? AND kind = ?", (channel, kind)
+    ).fetchall()
+
+
+def save_perceptual_hash(conn, channel, kind, value, file):
+    with conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO perceptual_hashes VALUES (?, ?, ?, ?)",
+            (channel, kind, value, file),
+        )
+
+
+def get_content_phash(conn, content_hash):
+    """
+    Returns (kind, hash) computed earlier for this content, or None.
+    """
+    return conn.execute(
+        "SELECT kind, hash FROM content_phashes WHERE content_hash = ?", (content_hash,)
+    ).fetchone()
+
+
+def save_content_phash(conn, content_hash, kind, value):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO content_phashes VALUES (?, ?, ?)",
+            (content_hash, kind, value),
+        )
+
+
+ROLLUP_COLUMNS = ("day", "channel", "file_type")
+
+
+def rebuild_rollups(conn):
+    """
+    Recomputes the daily channel/file-type rollups from the raw upload log.
+    """
+    with conn:
+        conn.execute("DELETE FROM upload_rollup")
+        conn.execute(
+            "INSERT INTO upload_rollup "
+            "SELECT date(ts_us / 1000000, 'unixepoch'), channel, file_type, COUNT(*), SUM(size) "
+            "FROM upload_log GROUP BY 1, 2, 3"
+        )
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollup_built', 1)")
+
+
+def query_rollups(conn, by, start=None, end=None, channels=(), file_types=()):
+    """
+    Sums uploads and bytes from the rollups, grouped by the columns in `by`.
+
+    Returns:
+        A list of rows: the `by` values followed by uploads and bytes.
+    """
+    by = [column for column in by if column in ROLLUP_COLUMNS]
+    where, params = [], []
+    if start:
+        where.append("day >= ?")
+        params.append(str(start))
+    if end:
+        where.append("day <= ?")
+        params.append(str(end))
+    for column, values in (("channel", channels), ("file_type", file_types)):
+        if values:
+            where.append(f"{column} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+    query = f"SELECT {', '.join(by + ['SUM(uploads)', 'SUM(bytes)'])} FROM upload_rollup"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    if by:
+        query += f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}"
+    return conn.execute(query, params).fetchall()
+
+
+def upload_count(conn):
+    return conn.execute("SELECT value FROM meta WHERE key = 'upload_count'").fetchone()[0]
+
+
+def count_uploads(db_file):
+    """
+    Number of uploaded files, without keeping a connection open.
+    """
+    if not os.path.exists(db_file):
+        return 0
+    conn = connect(db_file)
+    try:
+        return upload_count(conn)
+    finally:
+        conn.close()
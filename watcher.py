@@ -0,0 +1,227 @@
+# watcher.py
+#
+# Headless ingest daemon: watches the folders mapped in the channel sheet and posts new
+# files within seconds, without anyone opening the Uploads page.
+#
+#   python watcher.py [sheet.xlsx] [--mode "Media Group"|"One-by-One"] [--poll]
+#
+# Folder events come from inotify (or the platform's native API) through watchdog, with a
+# polling observer as fallback. A file is sent once its size and mtime have not changed for
+# WATCH_SETTLE_SECONDS; files of one folder that settle close together go out as one batch,
+# so they are packed into media groups. Sending goes through controller.upload_folder, with
+# the same dedup, conversion and logging as a normal upload.
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from collections import defaultdict
+import pandas as pd
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+from model import config, SUPPORTED_EXTENSIONS
+import store
+from client_pool import pool
+from controller import session_path, row_folder, upload_scheduler, upload_folder, delete_sent, no_progress
+
+TICK_SECONDS = 0.5
+RETRY_SECONDS = 60      # files a batch could not send are tried again after this long
+
+
+def load_sheet(sheet_file):
+    """
+    Returns:
+        {absolute folder: [(index, row), ...]} for the sheet's Channel Link / Actress rows.
+    """
+    df = pd.read_excel(sheet_file)
+    folders = defaultdict(list)
+    for index, row in df[["Channel Link", "Actress"]].astype(str).iterrows():
+        folder_raw, folder = row_folder(row)
+        if not folder_raw or folder_raw.lower() == "nan":
+            continue
+        folders[folder].append((index, row))
+    return folders
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, loop, notify):
+        self.loop = loop
+        self.notify = notify
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in ("created", "modified", "moved", "closed"):
+            return
+        path = getattr(event, "dest_path", "") or event.src_path
+        self.loop.call_soon_threadsafe(self.notify, os.fsdecode(path))
+
+
+def _report(task):
+    # Batch tasks are never awaited, so their errors would otherwise vanish
+    if not task.cancelled() and task.exception():
+        print(f"❌ Watch batch failed: {task.exception()!r}")
+
+
+class Watcher:
+    def __init__(self, sheet_file, mode="Media Group", poll=False):
+        self.sheet_file = sheet_file
+        self.mode = mode
+        self.poll = poll
+        self.folders = {}
+        self.sheet_mtime = None
+        self.observer = None
+        self.pending = {}                   # path -> (size, mtime_ns, monotonic time of last change)
+        self.ready = defaultdict(dict)      # folder -> {name: monotonic time it settled}
+        self.sending = set()                # folders with a batch in flight
+
+    def notify(self, path):
+        folder, name = os.path.split(os.path.abspath(path))
+        if folder in self.folders and os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+            self.pending.setdefault(path, (None, None, time.monotonic()))
+
+    def _start_observer(self, loop):
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+        handler = _Handler(loop, self.notify)
+        for observer_class in ((PollingObserver,) if self.poll else (Observer, PollingObserver)):
+            observer = observer_class()
+            try:
+                for folder in self.folders:
+                    if os.path.isdir(folder):
+                        observer.schedule(handler, folder, recursive=False)
+                observer.start()
+            except OSError as e:
+                # inotify watch limits and the like: fall back to polling
+                print(f"{observer_class.__name__} failed ({e}), falling back to polling")
+                continue
+            self.observer = observer
+            print(f"Watching {len(self.folders)} folders with {observer_class.__name__}")
+            return
+        raise RuntimeError("No folder observer could be started")
+
+    def reload_sheet(self, loop):
+        # Re-read the sheet when it changes; files already in the folders are picked up too
+        try:
+            mtime = os.path.getmtime(self.sheet_file)
+        except OSError:
+            return
+        if mtime == self.sheet_mtime:
+            return
+        self.sheet_mtime = mtime
+        self.folders = load_sheet(self.sheet_file)
+        self._start_observer(loop)
+        for folder in self.folders:
+            if os.path.isdir(folder):
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        if entry.is_file():
+                            self.notify(entry.path)
+
+    def settle(self):
+        # Moves files whose size and mtime held still for WATCH_SETTLE_SECONDS into ready
+        now = time.monotonic()
+        for path, (size, mtime, changed) in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]      # removed or renamed away before it settled
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                self.pending[path] = (st.st_size, st.st_mtime_ns, now)
+            elif now - changed >= config["watch_settle_seconds"]:
+                del self.pending[path]
+                folder, name = os.path.split(os.path.abspath(path))
+                self.ready[folder][name] = now
+
+    def due_batches(self):
+        # A folder's batch goes out once no file joined it for WATCH_BATCH_SECONDS, or it fills an album
+        now = time.monotonic()
+        for folder, names in list(self.ready.items()):
+            if folder in self.sending or not names or max(names.values()) > now:
+                continue
+            waiting = any(os.path.dirname(os.path.abspath(p)) == folder for p in self.pending)
+            if len(names) >= 10 or (not waiting and now - max(names.values()) >= config["watch_batch_seconds"]):
+                yield folder, set(self.ready.pop(folder))
+
+    def requeue_unsent(self, conn, folder, names, rows):
+        # Files still in the folder that a row did not record as sent go out again after RETRY_SECONDS
+        unsent = set()
+        for index, row in rows:
+            unsent |= names - store.handled_names(conn, row["Actress"].strip(), row["Channel Link"].strip())
+        unsent = {name for name in unsent if os.path.exists(os.path.join(folder, name))}
+        retry_at = time.monotonic() + RETRY_SECONDS
+        for name in unsent:
+            self.ready[folder].setdefault(name, retry_at)
+        if unsent:
+            print(f"Retrying {len(unsent)} unsent files from {folder} in {RETRY_SECONDS}s")
+
+    async def send(self, client, scheduler, conn, hash_locks, hash_limit, folder, names):
+        self.sending.add(folder)
+        logs = []
+        sent_paths = {}
+        started = time.monotonic()
+        rows = self.folders.get(folder, [])
+        try:
+            results = await asyncio.gather(*(
+                upload_folder(client, scheduler, conn, hash_locks, hash_limit, sent_paths, index, row, self.mode,
+                              "None", {}, logs, no_progress, only=names)
+                for index, row in rows
+            ), return_exceptions=True)
+            for (index, row), result in zip(rows, results):
+                if isinstance(result, Exception):
+                    logs.append(f"❌ Upload failed for row {index + 2} ({row['Actress']}): {result}")
+            # Requeue before deleting: a file one row sent and another did not stays on disk for the retry
+            self.requeue_unsent(conn, folder, names, rows)
+            delete_sent(conn, [row for _, row in rows], sent_paths, logs)
+        finally:
+            self.sending.discard(folder)
+        for log in logs:
+            print(log)
+        print(f"Sent batch of {len(names)} from {folder} in {time.monotonic() - started:.1f}s")
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        logs = []
+        scheduler = upload_scheduler(logs)
+        conn = store.connect(config["db_file"])
+        hash_locks = defaultdict(asyncio.Lock)
+        hash_limit = asyncio.Semaphore(config["hash_workers"])
+        tasks = set()
+        try:
+            # The worker's session, so the daemon needs no login of its own
+            async with pool.client(session_path) as client:
+                while True:
+                    self.reload_sheet(loop)
+                    self.settle()
+                    for folder, names in self.due_batches():
+                        task = asyncio.create_task(self.send(client, scheduler, conn, hash_locks, hash_limit, folder, names))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                        task.add_done_callback(_report)
+                    while logs:
+                        print(logs.pop(0))     # FloodWait notices from the scheduler
+                    await asyncio.sleep(TICK_SECONDS)
+        finally:
+            if self.observer:
+                self.observer.stop()
+                self.observer.join()
+            for task in tasks:
+                task.cancel()
+            await pool.close()
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post files dropped into the sheet's folders to their channels.")
+    parser.add_argument("sheet", nargs="?", default=config["watch_sheet"], help="Excel sheet with Channel Link and Actress columns")
+    parser.add_argument("--mode", choices=["Media Group", "One-by-One"], default="Media Group")
+    parser.add_argument("--poll", action="store_true", help="poll folders instead of using native file events")
+    args = parser.parse_args()
+    if not os.path.exists(args.sheet):
+        sys.exit(f"Sheet not found: {args.sheet}")
+    try:
+        asyncio.run(Watcher(args.sheet, args.mode, args.poll).run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,134 @@
+# worker.py
+#
+# Background job worker. The Streamlit pages only queue jobs in the upload store;
+# this process runs them, so uploads survive page refreshes and several users can queue work.
+#
+#   python worker.py
+
+import os
+import uuid
+import shutil
+import asyncio
+from datetime import date
+import pandas as pd
+from model import config
+import store
+
+def submit_job(kind, payload):
+    conn = store.connect(config["db_file"])
+    try:
+        return store.enqueue_job(conn, kind, payload)
+    finally:
+        conn.close()
+
+
+def submit_upload(df_upload, mode, filter_method="None", filter_params=None):
+    params = {
+        key: value.isoformat() if isinstance(value, date) else value
+        for key, value in (filter_params or {}).items()
+    }
+    rows = df_upload[["Channel Link", "Actress"]].astype(str).to_dict("records")
+    return submit_job("upload", {"rows": rows, "mode": mode, "filter_method": filter_method, "filter_params": params})
+
+
+def submit_mobile(channel, uploaded_files):
+    # Uploaded files only live in the Streamlit session, so keep a copy for the worker
+    folder = os.path.join(config["jobs_dir"], f"mobile_{uuid.uuid4().hex}")
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for file in uploaded_files:
+        path = os.path.join(folder, os.path.basename(file.name))
+        with open(path, "wb") as f:
+            f.write(file.getbuffer())
+        paths.append(path)
+    return submit_job("mobile", {"channel": channel, "files": paths, "folder": folder})
+
+
+def submit_download(channel, save_path):
+    return submit_job("download", {"channel": channel, "save_path": save_path})
+
+
+def recent_jobs(kind=None, limit=10):
+    conn = store.connect(config["db_file"])
+    try:
+        return store.list_jobs(conn, kind, limit)
+    finally:
+        conn.close()
+
+
+def _filter_params(params):
+    for key in ("start_date", "end_date"):
+        if params.get(key):
+            params[key] = date.fromisoformat(params[key])
+    return params
+
+
+async def run_job(job_id, kind, payload):
+    # Imported here so the UI, which imports this module to submit jobs, does not load the controller and its client pool
+    from controller import handle_upload, send_mobile_files, download_media_from_channel
+
+    conn = store.connect(config["db_file"])
+
+    def progress(files=0, nbytes=0, total=0):
+        store.add_job_progress(conn, job_id, files, nbytes, total)
+
+    # Shared with the job so the logs collected before a failure are kept
+    logs = []
+    try:
+        if kind == "upload":
+            await handle_upload(
+                pd.DataFrame(payload["rows"]),
+                payload["mode"],
+                payload["filter_method"],
+                _filter_params(payload["filter_params"]),
+                progress=progress,
+                logs=logs,
+            )
+        elif kind == "mobile":
+            await send_mobile_files(payload["channel"], payload["files"], progress=progress, logs=logs)
+            shutil.rmtree(payload["folder"], ignore_errors=True)
+        elif kind == "download":
+            count = await download_media_from_channel(payload["channel"], payload["save_path"], logs, progress=progress)
+            logs.append(f"✅ Downloaded {count} media files.")
+        else:
+            raise ValueError(f"Unknown job kind: {kind}")
+        store.finish_job(conn, job_id, "done", logs)
+    except Exception as e:
+        logs.append(f"❌ Job failed: {e}")
+        store.finish_job(conn, job_id, "failed", logs)
+    finally:
+        conn.close()
+
+
+async def run_worker(concurrency, poll_seconds=1.0):
+    conn = store.connect(config["db_file"])
+    requeued = store.requeue_running_jobs(conn)
+    if requeued:
+        print(f"Requeued {requeued} interrupted jobs")
+
+    running = {}
+    try:
+        while True:
+            while len(running) < concurrency:
+                # Jobs of one kind would race on the same folders and channels, so only one of each runs at a time
+                job = store.claim_next_job(conn, running.values())
+                if not job:
+                    break
+                job_id, kind, payload = job
+                print(f"Starting job {job_id} ({kind})")
+                running[asyncio.create_task(run_job(job_id, kind, payload))] = kind
+
+            if running:
+                done, _ = await asyncio.wait(running, timeout=poll_seconds, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    del running[task]
+            else:
+                await asyncio.sleep(poll_seconds)
+    finally:
+        # Jobs lease warm clients from the process-wide pool; close them on the way out
+        from client_pool import pool
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker(config["worker_concurrency"]))